@@ -0,0 +1,522 @@
+import taco_vis as tv
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+import os
+import io
+import sys
+import contextlib
+import json
+import argparse
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+
+########################
+# Timing helpers
+def best_of(func, repeat=3):
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+########################
+# th_resolution: per (radius, time) np.interp loop vs resample_theta
+def loop_resample(data, th_resolution):
+    # The original implementation of the FLOW.th_resolution setter
+    theta = np.linspace(0, 2 * np.pi, th_resolution)
+    theta_old = np.linspace(0, 2 * np.pi, data.shape[1])
+    temp = np.zeros((data.shape[0], th_resolution, data.shape[2]))
+    for i in range(temp.shape[0]):
+        for j in range(temp.shape[2]):
+            temp[i, :, j] = np.interp(theta, theta_old, data[i, :, j])
+    return temp
+
+
+def bench_th_resolution(shapes, th_resolution):
+    print("\nth_resolution (best of 3, seconds)")
+    print("%-18s %10s %10s %8s" % ("shape", "loop", "vector", "speedup"))
+    for shape in shapes:
+        data = np.random.rand(*shape)
+        t_loop = best_of(lambda: loop_resample(data, th_resolution))
+        t_vec = best_of(lambda: tv.resample_theta(data, th_resolution))
+        assert np.array_equal(
+            loop_resample(data, th_resolution),
+            tv.resample_theta(data, th_resolution),
+        )
+        print(
+            "%-18s %10.4f %10.4f %7.1fx"
+            % (str(shape), t_loop, t_vec, t_loop / t_vec)
+        )
+
+
+########################
+# Movie export: FuncAnimation.save vs raw frame pipe to ffmpeg
+def bench_export(shape, n_frames, dpi=100):
+    print(
+        "\nmovie export, %d frames at %ddpi (frames per second)"
+        % (n_frames, dpi)
+    )
+    print("%-14s %12s %12s %8s" % ("plot", "matplotlib", "pipe", "speedup"))
+    data = np.random.rand(*shape) - 0.5
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in ["cylinders", "cylinders_3D", "contours"]:
+            fps = []
+            for writer in ["matplotlib", "pipe"]:
+                f = tv.FLOW(data)
+                f.time = f.time[:n_frames]
+                f.dpi = dpi
+                f.movie_writer = writer
+                f.movie_filename = os.path.join(tmp, writer + ".mp4")
+                t0 = time.perf_counter()
+                getattr(f, "plot_" + kind)(animate=True, save=True)
+                fps.append(n_frames / (time.perf_counter() - t0))
+                plt.close("all")
+            print(
+                "%-14s %12.1f %12.1f %7.1fx"
+                % (kind, fps[0], fps[1], fps[1] / fps[0])
+            )
+
+
+########################
+# Contour plots: contourf vs raster mode, per frame update and draw of the
+# templates saved output is drawn with
+def bench_contour_modes(shapes, n_frames=20, dpi=200):
+    print("\ncontour modes, update + draw at %ddpi (seconds per frame)" % dpi)
+    print("%-18s %10s %10s %8s" % ("shape", "contour", "raster", "speedup"))
+    for shape in shapes:
+        r, th, t = np.meshgrid(
+            np.linspace(0, 1, shape[0]),
+            np.linspace(0, 2 * np.pi, shape[1]),
+            np.linspace(0, 1, shape[2]),
+            indexing="ij",
+        )
+        f = tv.FLOW(np.sin(9 * th + 25 * r) * np.sin(2 * np.pi * t))
+        f.progress = False
+        times = []
+        f.dpi = dpi
+        for kind in ["contours", "raster"]:
+            fig, update = tv.make_figure(f, kind, template=True)
+            fig.set_dpi(dpi)
+            tv.draw_canvas(fig.canvas)
+            t0 = time.perf_counter()
+            for i in range(n_frames):
+                update(i)
+                tv.draw_canvas(fig.canvas)
+            times.append((time.perf_counter() - t0) / n_frames)
+            tv.close_figure(fig)
+        print(
+            "%-18s %10.4f %10.4f %7.1fx"
+            % (str(shape), times[0], times[1], times[0] / times[1])
+        )
+
+
+########################
+# Still images: a plot per image vs render_stills
+def bench_stills(shape, n_images, dpi=100):
+    print("\nstill images, %d at %ddpi (images per second)" % (n_images, dpi))
+    print("%-14s %12s %12s %8s" % ("plot", "plot_*", "stills", "speedup"))
+    data = np.random.rand(*shape) - 0.5
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in ["cylinders", "cylinders_3D", "contours"]:
+            f = tv.FLOW(data)
+            f.dpi = dpi
+            rate = []
+            with contextlib.redirect_stdout(io.StringIO()):
+                t0 = time.perf_counter()
+                for i in range(n_images):
+                    f.image_filename = os.path.join(tmp, "plot_%d.png" % i)
+                    getattr(f, "plot_" + kind)(save=True, time_idx=i)
+                    plt.close("all")
+                rate.append(n_images / (time.perf_counter() - t0))
+                t0 = time.perf_counter()
+                f.render_stills(
+                    range(n_images), os.path.join(tmp, "still_{}.png"), kind
+                )
+                rate.append(n_images / (time.perf_counter() - t0))
+            print(
+                "%-14s %12.1f %12.1f %7.1fx"
+                % (kind, rate[0], rate[1], rate[1] / rate[0])
+            )
+
+
+########################
+# Cylinder plots: setup and update + draw time against the number of shells
+def bench_cylinders(n_cylinders, n_frames=10, dpi=100):
+    print("\ncylinder plots by shell count at %ddpi (seconds)" % dpi)
+    print(
+        "%-14s %8s %8s %10s %10s"
+        % ("plot", "shells", "artists", "setup", "frame")
+    )
+    for kind in ["cylinders", "cylinders_3D"]:
+        for n in n_cylinders:
+            t = np.linspace(0, 1, n_frames)
+            r = np.linspace(0, 1, n + 1)[:, None]
+            f = tv.FLOW(np.sin(2 * np.pi * (3 * r + t)))
+            f.progress = False
+
+            # First figure of this shell count builds the geometry
+            tv.cylinder_dots.cache_clear()
+            tv.cylinder_3D_layout.cache_clear()
+            t0 = time.perf_counter()
+            fig, update = tv.make_figure(f, kind)
+            t_setup = time.perf_counter() - t0
+
+            fig.set_dpi(dpi)
+            fig.canvas.draw()
+            t0 = time.perf_counter()
+            for i in range(n_frames):
+                update(i)
+                fig.canvas.draw()
+            t_frame = (time.perf_counter() - t0) / n_frames
+            n_artists = len(fig.axes[0].get_children())
+            plt.close(fig)
+            print(
+                "%-14s %8d %8d %10.4f %10.4f"
+                % (kind, n, n_artists, t_setup, t_frame)
+            )
+
+
+########################
+# Interactive playback: first loop drawn, later loops from the frame cache
+def bench_frame_cache(shape, dpi=100):
+    print("\nplayback frame cache at %ddpi (seconds per frame, MB)" % dpi)
+    print(
+        "%-14s %10s %10s %10s %10s %8s"
+        % ("plot", "compress", "draw", "replay", "MB/frame", "speedup")
+    )
+    data = np.random.rand(*shape) - 0.5
+    for kind in ["cylinders", "cylinders_3D", "contours"]:
+        for compress in [False, True]:
+            f = tv.FLOW(data)
+            f.frame_cache_mb = 2 ** 12
+            f.frame_cache_compress = compress
+            with contextlib.redirect_stdout(io.StringIO()):
+                getattr(f, "plot_" + kind)(animate=True)
+            fig = f.ani._fig
+            fig.set_dpi(dpi)
+            fig.canvas.draw()
+
+            # Step the animation as its timer would, one loop plus the step
+            # that starts the next loop
+            n = len(f.frame_indices())
+            times = []
+            for loop in range(2):
+                t0 = time.perf_counter()
+                for i in range(n + 1):
+                    f.ani._step()
+                times.append((time.perf_counter() - t0) / n)
+            mb = f.frame_cache.nbytes / 2 ** 20 / len(f.frame_cache)
+            plt.close(fig)
+            print(
+                "%-14s %10s %10.4f %10.4f %10.2f %7.1fx"
+                % (kind, compress, times[0], times[1], mb, times[0] / times[1])
+            )
+
+
+########################
+# Suite: setup, update, draw and export time and peak memory of every plot and
+# the th_resolution setter over a matrix of data shapes. Results are saved as
+# JSON so runs from different versions can be compared.
+SUITE_PLOTS = ["cylinders", "cylinders_3D", "contours", "raster"]
+
+# (radius, theta, time), theta of 0 being 2D axisymmetric data
+SUITE_SHAPES = [
+    (16, 0, 200),
+    (64, 0, 200),
+    (16, 64, 200),
+    (64, 256, 200),
+]
+
+
+def suite_data(shape):
+    r, th, t = shape
+    radius = np.linspace(0, 1, r)[:, np.newaxis, np.newaxis]
+    theta = np.linspace(0, 2 * np.pi, max(th, 1))[np.newaxis, :, np.newaxis]
+    time = np.linspace(0, 1, t)[np.newaxis, np.newaxis, :]
+    data = np.sin(9 * theta + 25 * radius) * np.sin(2 * np.pi * time)
+    return data[:, 0, :] if th == 0 else data
+
+
+def peak_memory(func):
+    # Peak memory (MB) allocated while running func, traced separately from
+    # the timings as tracing slows allocation down
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def bench_plot(kind, shape, n_frames, dpi, tmp):
+    f = tv.FLOW(suite_data(shape))
+    f.progress = False
+    f.dpi = dpi
+    f.max_frames = n_frames
+    f.movie_filename = os.path.join(tmp, kind + ".mp4")
+
+    def setup():
+        fig, update = tv.make_figure(f, kind)
+        plt.close(fig)
+
+    def template_setup():
+        fig, update = tv.make_figure(f, kind, template=True)
+        tv.close_figure(fig)
+
+    fig, update = tv.make_figure(f, kind)
+    fig.set_dpi(dpi)
+    t0 = time.perf_counter()
+    for i in range(n_frames):
+        update(i)
+    t_update = (time.perf_counter() - t0) / n_frames
+    t0 = time.perf_counter()
+    for i in range(n_frames):
+        update(i)
+        fig.canvas.draw()
+    t_frame = (time.perf_counter() - t0) / n_frames
+    plt.close(fig)
+
+    def export():
+        # Without the progress messages
+        with contextlib.redirect_stdout(io.StringIO()):
+            if kind == "raster":
+                f.plot_contours(animate=True, save=True, mode="raster")
+            else:
+                getattr(f, "plot_" + kind)(animate=True, save=True)
+        plt.close("all")
+
+    return {
+        "bench": "plot_" + kind,
+        "shape": list(shape),
+        "setup_s": best_of(setup),
+        "template_setup_s": best_of(template_setup),
+        "update_s": t_update,
+        "frame_s": t_frame,
+        "export_s": best_of(export, repeat=1),
+        "peak_mb": peak_memory(export),
+    }
+
+
+def bench_setter(shape, th_resolution):
+    data = suite_data(shape)
+
+    def setter():
+        f = tv.FLOW(data)
+        f.th_resolution = th_resolution
+
+    return {
+        "bench": "th_resolution",
+        "shape": list(shape),
+        "th_resolution": th_resolution,
+        "setter_s": best_of(setter),
+        "peak_mb": peak_memory(setter),
+    }
+
+
+# Budget for importing taco_vis on top of numpy, which it always needs.
+# matplotlib is only imported once a plot is made.
+IMPORT_BUDGET_S = 0.05
+
+
+def bench_import(repeat=5):
+    # Best time of importing taco_vis in a new process, after numpy
+    code = (
+        "import sys, time, numpy; t0 = time.perf_counter(); import taco_vis; "
+        "print(time.perf_counter() - t0, 'matplotlib' in sys.modules)"
+    )
+    times = []
+    for i in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(tv.__file__)),
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        ).stdout.split()
+        times.append(float(out[0]))
+    return {
+        "bench": "import",
+        "shape": [],
+        "import_s": min(times),
+        "matplotlib_imported": out[1] == "True",
+    }
+
+
+def suite_meta():
+    # Versions and machine the suite was run with
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(tv.__file__)),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+
+def bench_suite(filename, shapes=SUITE_SHAPES, n_frames=24, dpi=100):
+    results = []
+    print("\nsuite, %d frames at %ddpi (seconds, MB)" % (n_frames, dpi))
+    print(
+        "%-20s %-16s %8s %8s %8s %8s %8s %8s"
+        % (
+            "bench",
+            "shape",
+            "setup",
+            "template",
+            "update",
+            "frame",
+            "export",
+            "peak",
+        )
+    )
+    res = bench_import()
+    results.append(res)
+    print(
+        "%-20s %-16s %8.4f   budget %.3f%s"
+        % (
+            res["bench"],
+            "",
+            res["import_s"],
+            IMPORT_BUDGET_S,
+            "" if res["import_s"] <= IMPORT_BUDGET_S else "  OVER BUDGET",
+        )
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for shape in shapes:
+            for kind in SUITE_PLOTS:
+                res = bench_plot(kind, shape, n_frames, dpi, tmp)
+                results.append(res)
+                print(
+                    "%-20s %-16s %8.4f %8.4f %8.4f %8.4f %8.3f %8.1f"
+                    % (
+                        res["bench"],
+                        str(shape),
+                        res["setup_s"],
+                        res["template_setup_s"],
+                        res["update_s"],
+                        res["frame_s"],
+                        res["export_s"],
+                        res["peak_mb"],
+                    )
+                )
+            if shape[1] > 0:
+                res = bench_setter(shape, 2 * shape[1])
+                results.append(res)
+                print(
+                    "%-20s %-16s %8.4f %44.1f"
+                    % (
+                        res["bench"],
+                        str(shape),
+                        res["setter_s"],
+                        res["peak_mb"],
+                    )
+                )
+
+    with open(filename, "w") as f:
+        json.dump({"meta": suite_meta(), "results": results}, f, indent=1)
+    print("\nSaved " + filename)
+
+
+def compare(old_file, new_file, threshold=1.2):
+    # Ratio new/old of every measurement in two suite results, flagging those
+    # that got worse by more than threshold
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+
+    def key(res):
+        return (res["bench"], tuple(res["shape"]))
+
+    old_results = {key(res): res for res in old["results"]}
+
+    print(
+        "\n%s (%s) -> %s (%s)"
+        % (old_file, old["meta"]["commit"], new_file, new["meta"]["commit"])
+    )
+    print(
+        "%-20s %-16s %-10s %10s %10s %7s"
+        % ("bench", "shape", "metric", "old", "new", "ratio")
+    )
+    n_worse = 0
+    for res in new["results"]:
+        if key(res) not in old_results:
+            continue
+        for metric, value in res.items():
+            if not (metric.endswith("_s") or metric.endswith("_mb")):
+                continue
+            before = old_results[key(res)].get(metric)
+            if not before:
+                continue
+            ratio = value / before
+            flag = ""
+            if ratio > threshold:
+                flag = "  worse"
+                n_worse += 1
+            print(
+                "%-20s %-16s %-10s %10.4f %10.4f %6.2fx%s"
+                % (
+                    res["bench"],
+                    str(tuple(res["shape"])),
+                    metric,
+                    before,
+                    value,
+                    ratio,
+                    flag,
+                )
+            )
+    return n_worse
+
+
+if __name__ == "__main__":
+    matplotlib.use("Agg")
+
+    parser = argparse.ArgumentParser(description="taco_vis benchmarks")
+    parser.add_argument(
+        "--json",
+        metavar="FILE",
+        help="only run the suite over every plot and data shape, saving the "
+        "results to FILE",
+    )
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        help="compare two saved suite results, exiting with an error if any "
+        "measurement got more than 20%% worse",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare) else 0)
+    elif args.json:
+        bench_suite(args.json)
+    else:
+        bench_th_resolution(
+            [(16, 50, 500), (64, 64, 2000), (64, 128, 5000)],
+            th_resolution=100,
+        )
+        bench_export((16, 50, 100), n_frames=100)
+        bench_stills((16, 50, 100), n_images=20)
+        bench_cylinders([8, 32, 128, 512, 1024])
+        bench_frame_cache((16, 50, 50))
+        bench_contour_modes([(16, 50, 20), (64, 256, 20), (128, 512, 20)])
+        bench_suite("benchmarks.json")
@@ -15,12 +15,15 @@ sys.path.append('../') #So taco_vis.py is visible to import
 from taco_vis import FLOW
 
 ###############################################################################
-# Read in Cox et al. (2013) dataset
+# Read in Cox et al. (2013) dataset. The text file is parsed once and cached
+# next to it as a .npy file for later runs.
 data_file = "../cox_etal_2013.txt"  # Data file
-data = np.genfromtxt(data_file, delimiter=",")
+data = FLOW.from_text(data_file, delimiter=",").data[:, 0, :]
 
 ###############################################################################
-# Regrid the data down (too high resolution to be practically plotted as is)
+# Regrid the data down (too high resolution to be practically plotted as is).
+# A cubic spline keeps the oscillations smooth; FLOW.regrid is a faster linear
+# alternative for larger datasets.
 r, t = np.linspace(0, 1, data.shape[0]), np.linspace(0, 1, data.shape[1])
 time, radius = np.linspace(0, 1, 2000), np.linspace(0, 1, 16)
 
@@ -30,11 +33,11 @@ u = func(radius, time)
 ###############################################################################
 # Initialise FLOW class
 f = FLOW(u)
+f.time = np.linspace(0, 20, time.size)
 
 # Up the speed of texture advection
 f.speed = 5
 
-f.time = np.linspace(0, 20, time.size)
 f.title = "%.2f years"
 f.colorbar_title = "Velocity\n(dimensionless)"
 
@@ -14,6 +14,7 @@ setup(
     author_email="ee12sg@leeds.ac.uk",
     url="https://github.com/sam-greenwood/taco_vis",
     py_modules=["taco_vis"],
+    entry_points={"console_scripts": ["taco-vis=taco_vis:main"]},
     python_requires='>=3.6',
     install_requires=['numpy','matplotlib'],
     setup_requires=['numpy','matplotlib'],
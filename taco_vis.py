@@ -1,10 +1,18 @@
 import numpy as np
 import sys
-import matplotlib.pyplot as plt
-import matplotlib
-from matplotlib.patches import Polygon
-from matplotlib.collections import PatchCollection
-import matplotlib.animation as anim
+import os
+import subprocess
+import tempfile
+import mmap
+import hashlib
+import zlib
+import json
+import copy
+import threading
+import concurrent.futures
+import functools
+import collections
+from time import perf_counter
 
 ###############################################################################
 
@@ -35,7 +43,9 @@ class FLOW:
                 For contour plotting 2D datasets, by default 50 points in theta
                 are created. This can be changed by setting the
                 FLOW.th_resolution attribute to some other number after the
-                class has been initialised if the user wishes.
+                class has been initialised if the user wishes. The 2D data is
+                not copied: FLOW.data becomes a read-only (radius, theta, time)
+                view that repeats the original array in theta.
 
                 Default settings (self.__call__() method prints settings to screen):
                 self.speed = 1
@@ -47,8 +57,27 @@ class FLOW:
                 self.image_filename = "output.png"
                 self.dpi = 200
                 self.fps = 24
+                self.frame_hook = None
+
+                self.frame_start = None
+                self.frame_stop = None
+                self.frame_step = None
+                self.target_duration = None
+                self.max_frames = None
+
+                self.movie_writer = "matplotlib"
+                self.codec = "h264"
+                self.crf = None
+                self.pix_fmt = "yuv420p"
+
+                self.frame_cache_mb = None
+                self.frame_cache_compress = False
 
                 self.c_scale = maximum magnitude within the data
+                self.c_scale_growth = 1.5
+                self.cmap = "jet"
+
+                self.th_interpolation = "linear"
         """
 
         a = data.shape
@@ -81,14 +110,373 @@ class FLOW:
         self.dpi = 200
         self.fps = 24
 
-        self.c_scale = np.max(np.abs(data[:]))
+        # Timings of each frame drawn, see FrameStats. frame_hook is called
+        # with the index and timings of each frame as it is finished.
+        self.frame_hook = None
+        self.stats = FrameStats()
+
+        # Time indices drawn by animations (see frame_indices)
+        self.frame_start = None
+        self.frame_stop = None
+        self.frame_step = None
+        self.target_duration = None
+        self.max_frames = None
+
+        # Movie encoding. movie_writer = "pipe" draws frames straight into
+        # an ffmpeg process instead of using matplotlib's animation writer.
+        self.movie_writer = "matplotlib"
+        self.codec = "h264"
+        self.crf = None
+        self.pix_fmt = "yuv420p"
+
+        # Rendered frames of interactive playback kept in memory, so replays
+        # are copied rather than redrawn (see FrameCache). None disables it.
+        self.frame_cache_mb = None
+        self.frame_cache_compress = False
+        self.frame_cache = FrameCache()
+
+        self.c_scale = max_abs(data)
+        self.cmap = "jet"
+
+        # Factor c_scale is raised above the largest value when streamed data
+        # exceeds it (see append_frames)
+        self.c_scale_growth = 1.5
+
+        # Interpolation used when resampling theta (see resample_theta)
+        self.th_interpolation = "linear"
 
         # Assume that if only 1 point in theta is given, flow is not theta
         # dependant. Add in more theta points purely for contour plotting
-        # resolution
+        # resolution. The 2D array is kept so theta can be broadcast from it
+        # rather than copied.
 
         if th == 0:
+            self._axisymmetric_data = data
             self.th_resolution = 50
+        else:
+            self._axisymmetric_data = None
+
+        # State of a FLOW created with from_frames
+        self._stream = None
+
+    #################################
+
+    @classmethod
+    def from_npy(cls, filename, mmap=True):
+
+        """
+        Create a FLOW class from a .npy file.
+
+        Parameters
+        ----------
+
+            'filename' : str.
+                Path to the .npy file holding the 2D or 3D data array.
+            'mmap' : bool.
+                If True the file is memory-mapped rather than read into
+                memory, so only the parts of the data needed for each frame
+                are read from disk.
+
+        """
+
+        return cls(np.load(filename, mmap_mode="r" if mmap else None))
+
+    @classmethod
+    def from_text(cls, filename, delimiter=",", mmap=True):
+
+        """
+        Create a FLOW class from a text file, e.g. the comma separated
+        (radius x time) datasets of this project. The file is parsed once
+        and saved as a binary .npy cache next to it (filename + ".npy"),
+        which later calls load (memory-mapped by default) instead. The cache
+        is keyed by the size, modification time and SHA-1 hash of the text
+        file, so it is remade if the file changes.
+
+        Parameters
+        ----------
+
+            'filename' : str.
+                Path to the text file.
+            'delimiter' : str.
+                String separating the values on each line.
+            'mmap' : bool.
+                If True the cache is memory-mapped rather than read into
+                memory.
+
+        """
+
+        cache = filename + ".npy"
+        key_file = cache + ".key"
+
+        stat = os.stat(filename)
+        key = [str(stat.st_size), str(stat.st_mtime_ns)]
+        try:
+            with open(key_file) as f_key:
+                cached_key = f_key.read().split()
+        except OSError:
+            cached_key = []
+
+        if os.path.isfile(cache) and len(cached_key) == 3:
+            # Only hash the file if its size or time has changed
+            if cached_key[:2] == key:
+                return cls.from_npy(cache, mmap=mmap)
+            if cached_key[0] == key[0] and cached_key[2] == file_hash(
+                filename
+            ):
+                write_text_atomic(key_file, " ".join(key + cached_key[2:]))
+                return cls.from_npy(cache, mmap=mmap)
+
+        data = np.loadtxt(filename, delimiter=delimiter, ndmin=2)
+
+        try:
+            write_npy_atomic(cache, data)
+            write_text_atomic(
+                key_file, " ".join(key + [file_hash(filename)])
+            )
+        except OSError:
+            # Cannot write next to the file, so just use the parsed data
+            return cls(data)
+
+        return cls.from_npy(cache, mmap=mmap)
+
+    @classmethod
+    def from_raw(
+        cls, filename, shape, dtype=np.float64, offset=0, order="C", mmap=True
+    ):
+
+        """
+        Create a FLOW class from a raw binary file.
+
+        Parameters
+        ----------
+
+            'filename' : str.
+                Path to the binary file.
+            'shape' : tuple.
+                Shape of the 2D or 3D data array held in the file.
+            'dtype' : numpy dtype.
+                Data type of the values in the file.
+            'offset' : int.
+                Number of bytes before the start of the data.
+            'order' : str.
+                "C" or "F", the memory layout of the array in the file.
+            'mmap' : bool.
+                If True the file is memory-mapped rather than read into
+                memory, so only the parts of the data needed for each frame
+                are read from disk.
+
+        """
+
+        if mmap:
+            data = np.memmap(
+                filename,
+                dtype=dtype,
+                mode="r",
+                offset=offset,
+                shape=tuple(shape),
+                order=order,
+            )
+        else:
+            data = np.fromfile(
+                filename, dtype=dtype, count=int(np.prod(shape)), offset=offset
+            ).reshape(shape, order=order)
+
+        return cls(data)
+
+    @classmethod
+    def from_frames(cls, frames, window=100, time=None):
+
+        """
+        Create a FLOW class that time slices can be added to while they are
+        still being produced, e.g. by a running simulation (see
+        append_frames and plot_stream). Only the last `window` time slices
+        are kept in memory.
+
+        Parameters
+        ----------
+
+            'frames' : 2D or 3D numpy array.
+                First time slices, laid out as the data passed to FLOW.
+            'window' : int.
+                Number of time slices kept.
+            'time' : 1D numpy array.
+                Times of the slices. By default the slices are numbered from
+                1, as for FLOW.
+
+        """
+
+        frames = np.asarray(frames)
+
+        # Data is a ring buffer of time slices, filled by append_frames
+        flow = cls(np.zeros(frames.shape[:-1] + (window,)))
+        n_shells = flow.radius.size - 1
+        flow._stream = {
+            "data": flow.data if frames.ndim == 3 else flow._axisymmetric_data,
+            "n_frames": 0,
+            "mid_sum": np.zeros(n_shells),
+            "colour_settings": None,
+            "colours": np.zeros((n_shells, window, 4), dtype=np.uint8),
+            "phase": np.zeros((n_shells, window)),
+        }
+        flow.append_frames(frames, time=time)
+
+        return flow
+
+    def append_frames(self, frames, time=None):
+
+        """
+        Add time slices to a FLOW class created with from_frames. They
+        replace the oldest slices once the window is full, and the shell
+        colours and texture phase are extended as they arrive.
+
+        If the data exceeds c_scale, c_scale is raised to c_scale_growth
+        times the largest value, so the colour scale changes rarely.
+
+        Parameters
+        ----------
+
+            'frames' : numpy array.
+                One time slice (the data shape without its time axis), or
+                several with time as the last axis.
+            'time' : float or 1D numpy array.
+                Times of the slices. By default the numbering continues on
+                from the slices already added.
+
+        """
+
+        stream = self._stream
+        if stream is None:
+            raise ValueError(
+                "append_frames requires a FLOW created with from_frames"
+            )
+
+        data = stream["data"]
+        window = data.shape[-1]
+        n_frames = stream["n_frames"]
+        factor = 100
+
+        frames = np.asarray(frames, dtype=float)
+        if frames.ndim == data.ndim - 1:
+            frames = frames[..., np.newaxis]
+        if frames.shape[:-1] != data.shape[:-1]:
+            raise ValueError(
+                "Time slices must have shape " + str(data.shape[:-1])
+            )
+        n = frames.shape[-1]
+        if time is None:
+            time = np.arange(n_frames + 1, n_frames + n + 1)
+        time = np.broadcast_to(time, (n,))
+
+        # Velocity at the middle of each shell
+        v = frames if frames.ndim == 2 else frames[:, 0]
+        mid = (v[1:] + v[:-1]) / 2
+
+        # Only the last slices fit in the window, but the texture is advected
+        # through all of them.
+        keep = slice(max(0, n - window), n)
+        slots = np.arange(n_frames, n_frames + n)[keep] % window
+
+        data[..., slots] = frames[..., keep]
+        self.time[slots] = time[keep]
+        stream["n_frames"] = n_frames + n
+
+        m = max_abs(frames)
+        if m > self.c_scale:
+            self.c_scale = m * self.c_scale_growth
+
+        # Colours of the new slices, or of the whole window if the colour
+        # scale has changed
+        if stream["colour_settings"] == (self.c_scale, self.cmap):
+            stream["colours"][:, slots] = velocity_colours(mid[:, keep], self)
+        else:
+            self.shell_colours()
+
+        # Same sum as texture_phase, carried over from the previous slices
+        mid[:, 0] += stream["mid_sum"]
+        np.cumsum(mid, axis=1, out=mid)
+        stream["mid_sum"] = mid[:, -1]
+        stream["phase"][:, slots] = -mid[:, keep] * self.speed / factor
+
+    #################################
+
+    def regrid(self, n_radius=None, n_time=None, max_points=None):
+
+        """
+        Linearly interpolate the data onto a new number of points in radius
+        and time, e.g. to bring a high resolution dataset down to a size that
+        can be practically plotted. The new points are evenly spaced in
+        FLOW.radius and FLOW.time between their first and last values, and
+        the data is interpolated against those physical values, so unevenly
+        spaced input comes out on an even grid. The data is read in blocks
+        over time, so memory-mapped data is never loaded in full.
+
+        Parameters
+        ----------
+
+            'n_radius' : int.
+                Number of points in radius. By default unchanged.
+            'n_time' : int.
+                Number of points in time. By default unchanged.
+            'max_points' : int.
+                Budget for the number of (radius, time) points. Sets whichever
+                of n_radius and n_time is not given, or if neither is, scales
+                both down by the same factor. Points are never added to meet
+                the budget.
+
+        """
+
+        if self._stream is not None:
+            raise ValueError("Streamed data cannot be regridded")
+
+        if self._axisymmetric_data is not None:
+            data = self._axisymmetric_data
+        else:
+            data = self.data
+        r, ti = data.shape[0], data.shape[-1]
+
+        if max_points is not None:
+            if n_radius is None and n_time is None:
+                scale = min(1, np.sqrt(max_points / (r * ti)))
+                n_radius = max(2, int(r * scale))
+            if n_time is None:
+                n_time = min(ti, max(1, int(max_points // n_radius)))
+            if n_radius is None:
+                n_radius = min(r, max(2, int(max_points // n_time)))
+        n_radius = r if n_radius is None else int(n_radius)
+        n_time = ti if n_time is None else int(n_time)
+
+        # New points and their position on the current grids
+        radius = np.linspace(self.radius[0], self.radius[-1], n_radius)
+        i, w = bracket(self.radius, radius)
+        i1 = np.minimum(i + 1, r - 1)
+        w = w.reshape((-1,) + (1,) * (data.ndim - 1))
+
+        time = np.linspace(self.time[0], self.time[-1], n_time)
+        j, v = bracket(self.time, time)
+        j1 = np.minimum(j + 1, ti - 1)
+
+        # Work through time in blocks, each reading only the time slices it
+        # interpolates between. Unevenly spaced input can put more than the
+        # average number of slices between two new points.
+        step = int(np.diff(j).max(initial=0))
+        stride = max(1, int(np.ceil(ti / n_time)), step)
+        out = np.empty((n_radius,) + data.shape[1:-1] + (n_time,))
+        for t in time_blocks(n_time, data[..., 0].size * stride):
+            lo, hi = j[t][0], j1[t][-1] + 1
+            chunk = np.asarray(data[..., lo:hi], dtype=float)
+            chunk = (
+                chunk[..., j[t] - lo] * (1 - v[t])
+                + chunk[..., j1[t] - lo] * v[t]
+            )
+            out[..., t] = chunk[i] * (1 - w) + chunk[i1] * w
+
+        self.radius = radius
+        self.time = time
+        if self._axisymmetric_data is not None:
+            self._axisymmetric_data = out
+            self.th_resolution = self.th_resolution
+        else:
+            self.data = out
 
     #################################
 
@@ -103,15 +491,17 @@ class FLOW:
         self.__th_resolution = th_resolution
 
         theta = np.linspace(0, 2 * np.pi, th_resolution)
-        temp = np.zeros((self.radius.size, th_resolution, self.time.size))
-        for i in range(temp.shape[0]):
-            for j in range(temp.shape[2]):
-                if len(self.data.shape) == 2:
-                    temp[i, :, j] = self.data[i, j] * np.ones(theta.size)
-                else:
-                    theta_old = np.linspace(0,2*np.pi,self.theta.size)
-                    temp[i, :, j] = np.interp(theta, theta_old,
-                                              self.data[i, :, j])
+        if self._axisymmetric_data is not None:
+            # Read-only view, every theta point shares the same memory
+            source = self._axisymmetric_data
+            temp = np.broadcast_to(
+                source[:, np.newaxis, :],
+                (source.shape[0], theta.size, source.shape[1]),
+            )
+        else:
+            temp = resample_theta(
+                self.data, th_resolution, method=self.th_interpolation
+            )
 
         self.data = temp
         self.theta = theta
@@ -133,7 +523,22 @@ class FLOW:
             "image_filename",
             "dpi",
             "fps",
+            "frame_hook",
+            "frame_start",
+            "frame_stop",
+            "frame_step",
+            "target_duration",
+            "max_frames",
+            "movie_writer",
+            "codec",
+            "crf",
+            "pix_fmt",
+            "frame_cache_mb",
+            "frame_cache_compress",
             "c_scale",
+            "c_scale_growth",
+            "cmap",
+            "th_interpolation",
         ]
 
         print("\nCURRENT SETTINGS ---------------")
@@ -143,7 +548,142 @@ class FLOW:
 
     #################################
 
-    def plot_cylinders(self, animate=False, save=False, time_idx=0):
+    def frame_indices(self):
+
+        """
+        Time indices drawn by animations. These are
+        range(len(time))[frame_start:frame_stop:frame_step], thinned out to
+        an even stride if there are more than max_frames, or more than fit
+        in target_duration seconds at fps.
+
+        Returns
+        -------
+
+            'frames' : range.
+                Time indices of the frames.
+
+        """
+
+        frames = range(len(self.time))[
+            self.frame_start : self.frame_stop : self.frame_step
+        ]
+
+        budget = []
+        if self.max_frames is not None:
+            budget.append(int(self.max_frames))
+        if self.target_duration is not None:
+            budget.append(int(round(self.target_duration * self.fps)))
+
+        if budget and len(frames) > max(1, min(budget)):
+            stride = int(np.ceil(len(frames) / max(1, min(budget))))
+            frames = frames[::stride]
+
+        return frames
+
+    #################################
+
+    def shell_colours(self):
+
+        """
+        Colours of each cylindrical shell through time, as used by the
+        cylinder plots. The velocity at the middle of each shell is scaled by
+        c_scale and mapped through the colormap once for the whole animation.
+
+        Returns
+        -------
+
+            'colours' : (n_shells, n_time, 4) uint8 numpy array.
+                RGBA colour of each shell (inside out) at each time index.
+
+        """
+
+        # Streamed data keeps its colours up to date as it is added. The
+        # whole window is coloured again if c_scale or cmap have changed.
+        if self._stream is not None:
+            stream = self._stream
+            if stream["colour_settings"] != (self.c_scale, self.cmap):
+                v = stream["data"]
+                v = v if v.ndim == 2 else v[:, 0]
+                stream["colours"][:] = velocity_colours(
+                    (v[1:] + v[:-1]) / 2, self
+                )
+                stream["colour_settings"] = (self.c_scale, self.cmap)
+            return stream["colours"]
+
+        data = self.data
+
+        # Work through time in blocks so memory-mapped data is never loaded
+        # in full
+        colours = np.empty((data.shape[0] - 1, data.shape[2], 4), np.uint8)
+        for t in time_blocks(data.shape[2], data.shape[0]):
+            v = np.asarray(data[:, 0, t], dtype=float)
+            mid = (v[1:] + v[:-1]) / 2
+            colours[:, t] = velocity_colours(mid, self)
+
+        return colours
+
+    #################################
+
+    def texture_phase(self, animate=False):
+
+        """
+        Angle each cylindrical shell's texture has been advected through by
+        every time index. This is the cumulative sum of the velocity at the
+        middle of each shell, so the texture of any frame can be drawn
+        without drawing the frames before it.
+
+        Parameters
+        ----------
+
+            'animate' : bool.
+                If False (stills), the phase only depends on the time index.
+                If True and animations skip time indices (see
+                frame_indices), the phase advanced from the first drawn frame
+                is divided by the stride between frames. The texture then
+                moves by the average velocity over the skipped steps each
+                frame, at the same rate as when every step is drawn, so it
+                cannot alias into spinning the wrong way.
+
+        Returns
+        -------
+
+            'phase' : (n_shells, n_time) numpy array.
+                Angular displacement of each shell (inside out) at each time
+                index.
+
+        """
+
+        # Streamed data keeps its phase up to date as it is added
+        if self._stream is not None:
+            return self._stream["phase"]
+
+        data = self.data
+        factor = 100
+
+        # Work through time in blocks so memory-mapped data is never loaded
+        # in full, carrying the sum over from the previous block.
+        phase = np.empty((data.shape[0] - 1, data.shape[2]))
+        total = np.zeros(data.shape[0] - 1)
+        for t in time_blocks(data.shape[2], data.shape[0]):
+            v = np.asarray(data[:, 0, t], dtype=float)
+            mid = (v[1:] + v[:-1]) / 2
+            mid[:, 0] += total
+            np.cumsum(mid, axis=1, out=phase[:, t])
+            total = phase[:, t][:, -1]
+
+        frames = self.frame_indices()
+        stride = abs(frames.step)
+        if animate and stride > 1 and len(frames):
+            start = phase[:, frames[0], np.newaxis]
+            phase = start + (phase - start) / stride
+
+        return -phase * self.speed / factor
+
+    #################################
+
+    def plot_cylinders(
+        self, animate=False, save=False, time_idx=0, workers=None
+    ):
 
         """
         Method for plotting flow as 2D concentric cylinders in an equitorial
@@ -159,70 +699,33 @@ class FLOW:
             'time_idx' : int.
                 If animate is False, a still image will be plotted at this time
                 index.
+            'workers' : int.
+                If animate and save are True, the frames of the movie are
+                rendered by this many processes in parallel.
 
         """
 
-        # Load in variables from self
-        data = self.data
-        time = self.time
-        radius = self.radius
-
-        speed = self.speed
-
-        movie_filename = self.movie_filename
-        image_filename = self.image_filename
-        dpi = self.dpi
-        fps = self.fps
-
         if save and animate:
             self.progress = True
         else:
             self.progress = False
+        self.stats.reset(self.frame_hook)
+        select_backend()
 
         # Plot first time index of data
-        fig, ax, p, update = cylinder_figure(self, time_idx=time_idx)
-
-        # Animate the figure through time if required
-        if animate:
-            frames = int(len(time))
-            self.ani = anim.FuncAnimation(
-                fig,
-                update,
-                frames=frames,
-                interval=10,
-                blit=False,
-                repeat=True,
-            )
-            print("\nAnimating...")
-
-            if save:
-                # Save the animation as a movie if needed
-                print(
-                    "Saving file "
-                    + movie_filename
-                    + " at "
-                    + str(dpi)
-                    + "dpi and "
-                    + str(fps)
-                    + "fps"
-                )
-                self.ani.save(movie_filename, dpi=dpi, fps=fps)
-                print("\nSAVED")
-
-            else:
-                plt.show()
-
-        elif save:
-            print("Saving file " + image_filename + " at " + str(dpi) + "dpi")
-            plt.savefig(image_filename, dpi=dpi)
-            print("\nSAVED")
+        fig, ax, p, update = cylinder_figure(
+            self, time_idx=time_idx, template=save, animate=animate
+        )
 
-        else:
-            plt.show()
+        self._show_or_save(
+            fig, update, "cylinders", animate, save, workers=workers
+        )
 
     #################################
 
-    def plot_cylinders_3D(self, animate=False, save=False, time_idx=0):
+    def plot_cylinders_3D(
+        self, animate=False, save=False, time_idx=0, workers=None
+    ):
 
         """
         Method for plotting flow as 3D concentric cylinders in an 3D view
@@ -237,74 +740,34 @@ class FLOW:
             'time_idx' : int.
                 If animate is False, a still image will be plotted at this time
                 index.
+            'workers' : int.
+                If animate and save are True, the frames of the movie are
+                rendered by this many processes in parallel.
 
         """
 
-        # Load in variables from self
-        data = self.data
-        time = self.time
-        radius = self.radius
-
-        speed = self.speed
-
-        movie_filename = self.movie_filename
-        image_filename = self.image_filename
-        dpi = self.dpi
-        fps = self.fps
-
         if save and animate:
             self.progress = True
         else:
             self.progress = False
+        self.stats.reset(self.frame_hook)
+        select_backend()
 
         # Plot first time index of data
-        fig, ax, cylinders, (
-            texture_funcs,
-            texture_plots,
-            texture_theta,
-        ), update = cylinder_3D_figure(self, time_idx=time_idx)
-
-        # Animate the figure through time if required
-        if animate:
-            frames = int(len(time))
-            self.ani = anim.FuncAnimation(
-                fig,
-                update,
-                frames=frames,
-                interval=10,
-                blit=False,
-                repeat=True,
-            )
-            print("\nAnimating...")
-
-            if save:
-                # Save the animation as a movie if needed
-                print(
-                    "Saving file "
-                    + movie_filename
-                    + " at "
-                    + str(dpi)
-                    + "dpi and "
-                    + str(fps)
-                    + "fps"
-                )
-                self.ani.save(movie_filename, dpi=dpi, fps=fps)
-                print("\nSAVED")
-
-            else:
-                plt.show()
-
-        elif save:
-            print("Saving file " + image_filename + " at " + str(dpi) + "dpi")
-            plt.savefig(image_filename, dpi=dpi)
-            print("\nSAVED")
+        fig, ax, cylinders, texture_line, update = cylinder_3D_figure(
+            self, time_idx=time_idx, template=save, animate=animate
+        )
 
-        else:
-            plt.show()
+        self._show_or_save(
+            fig, update, "cylinders_3D", animate, save, workers=workers
+        )
 
     #################################
 
-    def plot_contours(self, animate=False, save=False, time_idx=0):
+    def plot_contours(
+        self, animate=False, save=False, time_idx=0, workers=None,
+        mode="contour",
+    ):
 
         """
         Method for plotting flow as in an equitorial plane view with filled
@@ -320,136 +783,1976 @@ class FLOW:
             'time_idx' : int.
                 If animate is False, a still image will be plotted at this time
                 index.
+            'workers' : int.
+                If animate and save are True, the frames of the movie are
+                rendered by this many processes in parallel.
+            'mode' : str.
+                "contour" draws filled contours. "raster" instead fills a
+                single image through a precomputed polar to pixel map, which
+                looks almost the same and is much faster to animate.
+
+        """
+
+        # Check if progress needs to be written to screen for saving
+        if save:
+            self.progress = True
+        else:
+            self.progress = False
+        self.stats.reset(self.frame_hook)
+        select_backend()
+
+        # Set up and plot the first figure
+        if mode == "contour":
+            kind = "contours"
+            fig, ax, p, levels, update = contour_figure(
+                None,
+                self,
+                None,
+                setup=True,
+                time_idx=time_idx,
+                template=save,
+            )
+        elif mode == "raster":
+            kind = "raster"
+            fig, ax, im, update = raster_figure(
+                self, time_idx=time_idx, template=save
+            )
+        else:
+            raise ValueError("mode must be 'contour' or 'raster'")
+
+        self._show_or_save(fig, update, kind, animate, save, workers=workers)
+
+    #################################
+
+    def plot_stream(self, frames, kind="cylinders", save=False):
+
+        """
+        Method for animating time slices as they arrive, e.g. from a
+        generator reading the output of a running simulation. The class must
+        be created with from_frames. Each new slice is added with
+        append_frames and drawn straight away.
+
+        Parameters
+        ----------
+
+            'frames' : iterable.
+                Yields numpy arrays of one or more time slices, as taken by
+                append_frames.
+            'kind' : str.
+                Type of plot: "cylinders", "cylinders_3D", "contours" or
+                "raster".
+            'save' : bool.
+                If True each frame is encoded into movie_filename as it
+                arrives, rather than shown. The movie is finished when frames
+                is exhausted (or raises an error).
 
         """
 
-        # Load in variables from self
-        data = self.data
-        time = self.time
-        radius = self.radius
-        theta = self.theta
+        stream = self._stream
+        if stream is None:
+            raise ValueError(
+                "plot_stream requires a FLOW created with from_frames"
+            )
+        window = self.time.size
+
+        # Total number of frames is not known
+        self.progress = False
+        self.stats.reset(self.frame_hook)
+        select_backend()
+        import matplotlib.pyplot as plt
+
+        def setup():
+            fig, update = make_figure(
+                self,
+                kind,
+                time_idx=(stream["n_frames"] - 1) % window,
+                template=save,
+            )
+            if save:
+                movie_canvas(fig, self)
+            else:
+                plt.show(block=False)
+            return fig, update
+
+        def draw(start):
+            # Draw the frames from start that are still in the window
+            for n in range(
+                max(start, stream["n_frames"] - window), stream["n_frames"]
+            ):
+                update(n % window)
+                if save:
+                    write_movie_frame(proc, fig.canvas, self.stats)
+                else:
+                    plt.pause(0.001)
+
+        fig, update = setup()
+        c_scale = self.c_scale
+
+        if save:
+            print("\nStreaming to " + self.movie_filename)
+            proc = open_movie_pipe(self, *fig.canvas.get_width_height())
+
+        try:
+            draw(0)
+            for new in frames:
+                start = stream["n_frames"]
+                self.append_frames(new)
+
+                # The colour scale has grown, so the colorbar and levels
+                # are set up again.
+                if self.c_scale != c_scale:
+                    close_figure(fig)
+                    fig, update = setup()
+                    c_scale = self.c_scale
+
+                draw(start)
+        except BrokenPipeError:
+            # ffmpeg has stopped, its error is raised by close_movie_pipe
+            pass
+        finally:
+            if save:
+                close_movie_pipe(self, proc)
+                close_figure(fig)
+
+    #################################
+
+    def render_stills(
+        self, indices, pattern="frame_{:05d}.png", kind="cylinders",
+        threads=None,
+    ):
+
+        """
+        Method for saving still images at several time indices. The figure is
+        created once and updated for each index, rather than created again
+        for every image, and the images are compressed and written by a pool
+        of threads while the next one is drawn.
+
+        Parameters
+        ----------
+
+            'indices' : iterable of int.
+                Time indices to save.
+            'pattern' : str.
+                Filename of each image, formatted with its time index. The
+                extension sets the image format, which must be a raster
+                format: .png, .jpg, .jpeg, .tif or .tiff. Vector formats
+                (.pdf, .svg) can be saved one at a time with the plot
+                methods.
+            'kind' : str.
+                Type of plot: "cylinders", "cylinders_3D", "contours" or
+                "raster".
+            'threads' : int.
+                Number of threads writing images (default: the number of
+                CPUs, up to 4).
+
+        Returns
+        -------
+
+            'filenames' : list of str.
+                The saved images, in the order of indices.
+
+        """
+
+        # The images are saved from the pixels of the Agg canvas
+        extension = os.path.splitext(pattern)[1].lower()
+        if extension not in RASTER_EXTENSIONS:
+            raise ValueError(
+                "Unsupported image format "
+                + repr(extension)
+                + ", render_stills saves "
+                + ", ".join(RASTER_EXTENSIONS)
+                + " images"
+            )
+
+        indices = [int(i) for i in indices]
+        self.progress = True
+        self.stats.reset(self.frame_hook)
+        select_backend()
+
+        fig, update = make_figure(
+            self, kind, time_idx=indices[0] if indices else 0, template=True
+        )
+        print(
+            "Saving "
+            + str(len(indices))
+            + " images to "
+            + pattern
+            + " at "
+            + str(self.dpi)
+            + "dpi"
+        )
+        try:
+            filenames = save_stills(
+                self, fig, update, indices, pattern, threads
+            )
+        finally:
+            close_figure(fig)
+        print("\nSAVED")
+
+        return filenames
+
+    #################################
+
+    def view(self, kind="cylinders", time_idx=0, prefetch=8, debounce=0.1):
+
+        """
+        Method for showing a plot with a time slider and a play/pause
+        button. Only the time index selected is drawn, so any time of a long
+        run can be reached at once, and the frames around it are drawn in
+        the background so stepping to them is immediate (see Viewer). The
+        viewer is kept as FLOW.viewer.
+
+        Parameters
+        ----------
+
+            'kind' : str.
+                Type of plot: "cylinders", "cylinders_3D", "contours" or
+                "raster".
+            'time_idx' : int.
+                Time index shown first.
+            'prefetch' : int.
+                Number of frames drawn in the background on each side of the
+                time index shown. 0 disables drawing in the background.
+            'debounce' : float.
+                Seconds the slider must rest before a frame that is not yet
+                drawn is drawn, so dragging it stays responsive.
+
+        """
+
+        import matplotlib.pyplot as plt
+
+        self.progress = False
+        self.stats.reset(self.frame_hook)
+        select_backend()
+
+        self.viewer = Viewer(self, kind, time_idx, prefetch, debounce)
+        plt.show()
+
+    #################################
+
+    def _show_or_save(self, fig, update, kind, animate, save, workers=None):
+
+        # Animate, save or show a figure created by one of the plot methods
+
+        import matplotlib.pyplot as plt
+        import matplotlib.animation as anim
+
+        movie_filename = self.movie_filename
+        image_filename = self.image_filename
+        dpi = self.dpi
+        fps = self.fps
+
+        # Animate the figure through time if required
+        if animate:
+            frames = self.frame_indices()
+
+            if save and workers is not None and workers > 1:
+                # Each worker process draws its own copy of the figure
+                close_figure(fig)
+                print("\nAnimating...")
+                print(
+                    "Saving file "
+                    + movie_filename
+                    + " at "
+                    + str(dpi)
+                    + "dpi and "
+                    + str(fps)
+                    + "fps with "
+                    + str(workers)
+                    + " workers"
+                )
+                save_movie_parallel(self, kind, frames, workers)
+                print("\nSAVED")
+                return
+
+            if save and self.movie_writer == "pipe":
+                print("\nAnimating...")
+                print(
+                    "Saving file "
+                    + movie_filename
+                    + " at "
+                    + str(dpi)
+                    + "dpi and "
+                    + str(fps)
+                    + "fps"
+                )
+                try:
+                    save_movie_pipe(self, fig, update, frames)
+                finally:
+                    templates.release(fig)
+                print("\nSAVED")
+                return
+
+            if save:
+                # init_func stops FuncAnimation drawing frame 0 more than
+                # once, so every frame comes from exactly one call to update.
+                init, blit = lambda: [], False
+                animation, options = anim.FuncAnimation, {}
+            else:
+                # Blit interactive playback: the artists returned by update
+                # are animated and everything else is drawn once and cached.
+                # Drawn frames are kept for replays if frame_cache_mb is set.
+                init, blit = lambda: update(frames[0]), True
+                animation, options = playback_animation(), {}
+                if self.frame_cache_mb is not None:
+                    self.frame_cache.reset(
+                        self.frame_cache_mb, self.frame_cache_compress
+                    )
+                    options["frame_cache"] = self.frame_cache
+
+            self.ani = animation(
+                fig,
+                update,
+                frames=frames,
+                init_func=init,
+                interval=10,
+                blit=blit,
+                repeat=True,
+                **options,
+            )
+            print("\nAnimating...")
+
+            if save:
+                # Save the animation as a movie if needed
+                print(
+                    "Saving file "
+                    + movie_filename
+                    + " at "
+                    + str(dpi)
+                    + "dpi and "
+                    + str(fps)
+                    + "fps"
+                )
+                adjust_frame_size(fig, self)
+
+                def grabbed(i, n):
+                    # The writer draws and encodes the frame
+                    self.stats.lap("encode")
+                    self.stats.end()
+
+                try:
+                    self.ani.save(
+                        movie_filename,
+                        dpi=dpi,
+                        fps=fps,
+                        writer="ffmpeg",
+                        codec=self.codec,
+                        extra_args=encoder_args(self),
+                        progress_callback=grabbed,
+                    )
+                finally:
+                    templates.release(fig)
+                print("\nSAVED")
+
+            else:
+                plt.show()
+
+        # Save the plot as a picture if needed
+        elif save:
+            print("Saving file " + image_filename + " at " + str(dpi) + "dpi")
+            try:
+                fig.savefig(image_filename, dpi=dpi)
+            finally:
+                templates.release(fig)
+            print("\nSAVED")
+
+        # Plot the figure if not animating or saving
+        else:
+            plt.show()
+
+    def __getstate__(self):
+        # Animations and viewers cannot be pickled, so leave them behind
+        # when a copy of the class is sent to a worker process.
+        state = self.__dict__.copy()
+        state.pop("ani", None)
+        state.pop("viewer", None)
+
+        # Cached frames are only of use to the window that drew them
+        state["frame_cache"] = FrameCache()
+
+        # The hook may not be picklable, so worker processes record their
+        # own timings which are handed back (see save_movie_parallel).
+        state["frame_hook"] = None
+        state["stats"] = FrameStats()
+
+        # Memory-mapped arrays are reopened from their file rather than
+        # copied, and broadcast 2D data is broadcast again.
+        if state["_axisymmetric_data"] is not None:
+            state.pop("data")
+        state["_memmaps"] = {}
+        for key in ("data", "_axisymmetric_data"):
+            ref = memmap_reference(state.get(key))
+            if ref is not None:
+                state["_memmaps"][key] = ref
+                state[key] = None
+
+        return state
+
+    def __setstate__(self, state):
+        for key, ref in state.pop("_memmaps").items():
+            state[key] = np.memmap(ref[0], mode="r", **ref[1])
+        self.__dict__.update(state)
+
+        if "data" not in state:
+            self.th_resolution = self.th_resolution
+
+
+###############################################################################
+
+
+# Frame timing
+###############################################################################
+
+
+class FrameStats:
+    '''
+    Timings of each frame drawn by an animation, split into phases: reading
+    the data ("data"), updating the artists ("update"), drawing the canvas
+    ("draw") and writing it to the movie ("encode"). matplotlib's own movie
+    writer draws and encodes in one call, which is recorded as "encode"; set
+    FLOW.movie_writer = "pipe" to time them separately.
+
+    Each FLOW class holds one as FLOW.stats, reset by every plot method.
+    Recording a frame takes a few perf_counter calls, so it is always on.
+    Only the last max_frames frames are kept, so looping playback does not
+    grow the timings without bound.
+    '''
+
+    phases = ("data", "update", "draw", "encode")
+    max_frames = 100000
+
+    def __init__(self, hook=None):
+        self.reset(hook)
+
+    def reset(self, hook=None):
+
+        """
+        Clear the timings.
+
+        Parameters
+        ----------
+
+            'hook' : function.
+                Called as hook(i, timings) when each frame i is finished,
+                where timings is a dictionary of the seconds spent in each
+                phase.
+
+        """
+
+        self.hook = hook
+        self.frames = collections.deque(maxlen=self.max_frames)
+        self.times = {
+            phase: collections.deque(maxlen=self.max_frames)
+            for phase in self.phases
+        }
+        self._frame = None
+
+    def start(self, i):
+        # Start timing frame i, finishing the previous frame if it is open
+        if self._frame is not None:
+            self.end()
+        self._frame = i
+        self._timings = dict.fromkeys(self.phases, 0.0)
+        self._t = perf_counter()
+
+    def lap(self, phase):
+        # Add the time since the last lap to a phase of the open frame
+        if self._frame is None:
+            return
+        t = perf_counter()
+        self._timings[phase] += t - self._t
+        self._t = t
+
+    def end(self):
+        # Finish the open frame
+        if self._frame is None:
+            return
+        i, timings = self._frame, self._timings
+        self._frame = None
+        self.add(i, timings)
+
+    def add(self, i, timings):
+        # Record the timings of frame i
+        self.frames.append(i)
+        for phase in self.phases:
+            self.times[phase].append(timings[phase])
+        if self.hook is not None:
+            self.hook(i, timings)
+
+    def merge(self, other):
+        # Add the frames recorded by another FrameStats, e.g. from a worker
+        times = zip(*(other.times[p] for p in self.phases))
+        for i, t in zip(other.frames, times):
+            self.add(i, dict(zip(self.phases, t)))
+
+    def summary(self):
+
+        """
+        Summary of the timings.
+
+        Returns
+        -------
+
+            'summary' : dict.
+                For each phase and the whole frame ("frame"), the mean, 95th
+                percentile and total time in seconds.
+
+        """
+
+        times = {p: np.array(self.times[p]) for p in self.phases}
+        times["frame"] = sum(times.values())
+
+        summary = {"frames": len(self.frames)}
+        for phase, t in times.items():
+            if t.size == 0:
+                t = np.zeros(1)
+            summary[phase] = {
+                "mean": float(np.mean(t)),
+                "p95": float(np.percentile(t, 95)),
+                "total": float(np.sum(t)),
+            }
+        return summary
+
+    def to_json(self, filename=None):
+
+        """
+        Export the summary and the timings of every frame as JSON.
+
+        Parameters
+        ----------
+
+            'filename' : str.
+                File to write to. If None the JSON string is returned.
+
+        """
+
+        text = json.dumps(
+            {
+                "summary": self.summary(),
+                "frames": [int(i) for i in self.frames],
+                "times": {p: list(t) for p, t in self.times.items()},
+            }
+        )
+        if filename is None:
+            return text
+        with open(filename, "w") as f:
+            f.write(text)
+
+    def __str__(self):
+        summary = self.summary()
+        lines = [
+            "%d frames" % summary["frames"],
+            "%-8s %10s %10s %10s" % ("phase", "mean", "p95", "total"),
+        ]
+        for phase in self.phases + ("frame",):
+            lines.append(
+                "%-8s %10.5f %10.5f %10.3f"
+                % (
+                    phase,
+                    summary[phase]["mean"],
+                    summary[phase]["p95"],
+                    summary[phase]["total"],
+                )
+            )
+        return "\n".join(lines)
+
+
+###############################################################################
+
+
+# Figure templates
+###############################################################################
+
+
+class TemplateCache:
+    '''
+    Bounded cache of figure templates, shared by every FLOW class. A template
+    holds the static content of a plot (figure, axes, colorbar, outlines and
+    texture layout) and the rendered static background, keyed by the plot
+    type, grid and style settings (c_scale, cmap and colorbar_title, and dpi
+    for raster contours, whose image is sized to the saved pixels).
+    Saved renders of any FLOW class with the same key then only set their
+    data on the template and draw the dynamic layers (the data axes and
+    title) over the cached background.
+
+    Templates are only used for plots that are saved. Their figures are not
+    managed by pyplot, so they are never shown and stay open between
+    renders. A template is taken out of the cache while it is in use and put
+    back once the render is finished, and the least recently used templates
+    are dropped beyond max_size.
+
+    The module's cache is taco_vis.templates. Call templates.clear() after
+    changing matplotlib's rcParams, which are not part of the key.
+    '''
+
+    def __init__(self, max_size=8):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._templates = {}
+        self._in_use = {}
+
+    def __len__(self):
+        return len(self._templates)
+
+    def checkout(self, key, build):
+
+        """
+        Take the template of key out of the cache, building it if there is
+        none.
+
+        Parameters
+        ----------
+
+            'key' : tuple.
+                Plot type followed by everything its static content depends
+                on.
+            'build' : function.
+                Returns a new template as a dictionary, which must include
+                the "fig" and the dynamic "layers" drawn over the background.
+
+        Returns
+        -------
+
+            'template' : dict.
+                The template, with "fresh" True if it was just built.
+
+        """
+
+        template = self._templates.pop(key, None)
+        if template is None:
+            self.misses += 1
+            template = build()
+            template.update(key=key, fresh=True, background=None)
+            template["size"] = tuple(template["fig"].get_size_inches())
+            template["dpi"] = template["fig"].dpi
+        else:
+            self.hits += 1
+            template["fresh"] = False
+            # Undo any resizing of the last render
+            template["fig"].set_size_inches(template["size"])
+            template["fig"].set_dpi(template["dpi"])
+
+        self._in_use[id(template["fig"])] = template
+        return template
+
+    def in_use(self, fig):
+        # Template of a figure that is being rendered, if it is one
+        return self._in_use.get(id(fig))
+
+    def release(self, fig):
+        # Return the template of fig to the cache once its render is
+        # finished. Returns False if fig is not a template.
+        template = self._in_use.pop(id(fig), None)
+        if template is None:
+            return False
+        if not template.get("expired"):
+            # Dictionaries keep their order of insertion, so the first
+            # template is the least recently used
+            self._templates[template["key"]] = template
+        while len(self._templates) > max(0, self.max_size):
+            del self._templates[next(iter(self._templates))]
+        return True
+
+    def clear(self, kind=None):
+
+        """
+        Drop the cached templates. Templates in use are dropped once their
+        render is finished.
+
+        Parameters
+        ----------
+
+            'kind' : str.
+                Only drop templates of this plot type ("cylinders",
+                "cylinders_3D", "contours" or "raster").
+
+        """
+
+        for key in list(self._templates):
+            if kind is None or key[0] == kind:
+                del self._templates[key]
+        for template in self._in_use.values():
+            if kind is None or template["key"][0] == kind:
+                template["expired"] = True
+
+
+# Templates of saved plots
+templates = TemplateCache()
+
+
+def template_key(kind, flow_class, *grid):
+    # Key of the static content of a plot: its type, style settings and the
+    # grid it is drawn on. Arrays are keyed by a hash of their values.
+    cmap = get_colormap(flow_class.cmap)
+    key = [kind, float(flow_class.c_scale), flow_class.colorbar_title]
+    for a in grid + (cmap(np.linspace(0, 1, cmap.N)),):
+        if isinstance(a, np.ndarray):
+            a = (a.shape, hashlib.sha1(np.ascontiguousarray(a)).hexdigest())
+        key.append(a)
+    return tuple(key)
+
+
+def get_template(key, build, template):
+    # Static content of a plot, from the template cache if template is True
+    # or built afresh
+    if template:
+        return templates.checkout(key, build)
+    return dict(build(), fresh=True)
+
+
+def new_figure(template=False):
+    # Figure for a plot. Templates are not managed by pyplot, so they are
+    # drawn on an Agg canvas and never shown.
+    if template:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        return fig
+
+    import matplotlib.pyplot as plt
+
+    return plt.figure()
+
+
+def close_figure(fig):
+    # Finish with a figure: templates go back to the cache, any other figure
+    # is closed
+    if not templates.release(fig):
+        import matplotlib.pyplot as plt
+
+        plt.close(fig)
+
+
+def draw_canvas(canvas):
+    # Draw the figure of an Agg canvas. For a template, only its dynamic
+    # layers are drawn, over its static background. The background is
+    # rendered with the layers hidden whenever the canvas size changes.
+    fig = canvas.figure
+    template = templates.in_use(fig)
+    if template is None:
+        canvas.draw()
+        return
+
+    layers = template["layers"]
+    size = (canvas.get_width_height(), fig.dpi)
+    if template["background"] is None or template["background"][0] != size:
+        for layer in layers:
+            layer.set_visible(False)
+        canvas.draw()
+        for layer in layers:
+            layer.set_visible(True)
+        template["background"] = (size, canvas.copy_from_bbox(fig.bbox))
+
+    canvas.restore_region(template["background"][1])
+    for layer in layers:
+        fig.draw_artist(layer)
+
+
+###############################################################################
+
+
+# Interactive playback
+###############################################################################
+
+
+@functools.lru_cache(maxsize=None)
+def playback_animation():
+
+    # FuncAnimation used for interactive playback, defined on first use as
+    # matplotlib is imported lazily. matplotlib blits each axes by restoring
+    # its box rounded to whole pixels, so artists that reach the edge of the
+    # axes (the circle of the polar plots) build up on the pixels just
+    # outside it, frame after frame. This keeps the background of the whole
+    # figure instead, which costs one copy of the canvas per frame, so every
+    # frame matches a full draw.
+    #
+    # Given a FrameCache, each frame is drawn as usual the first time and
+    # its pixels kept; later it is copied straight onto the canvas and
+    # blitted. The artists of the last drawn frame are kept, so the next
+    # drawn frame still clears the canvas back to the background first. Only
+    # canvases drawn by Agg hold their pixels.
+
+    import matplotlib.animation as anim
+
+    class PlaybackAnimation(anim.FuncAnimation):
+        def __init__(self, *args, frame_cache=None, **kwargs):
+            self.frame_cache = frame_cache
+            super().__init__(*args, **kwargs)
+
+        def _draw_next_frame(self, framedata, blit):
+            canvas = self._fig.canvas
+            cache = self.frame_cache
+            if cache is None or not blit or not hasattr(canvas, "buffer_rgba"):
+                return super()._draw_next_frame(framedata, blit)
+
+            pixels = np.asarray(canvas.buffer_rgba())
+            view = (pixels.shape, axes_limits(self._fig.axes))
+            frame = cache.get(framedata, view)
+            if frame is None:
+                super()._draw_next_frame(framedata, blit)
+                cache.put(framedata, np.asarray(canvas.buffer_rgba()))
+            else:
+                pixels[...] = frame
+                canvas.blit(self._fig.bbox)
+
+        def _background_key(self):
+            # Anything that changes the background: the canvas size and
+            # the limits of each axes
+            return (
+                self._fig.canvas.get_width_height(),
+                axes_limits(self._fig.axes),
+            )
+
+        def _blit_clear(self, artists):
+            background = self._blit_cache.get(self._fig)
+            if background is None:
+                return
+            if background[0] == self._background_key():
+                self._fig.canvas.restore_region(background[1])
+            else:
+                del self._blit_cache[self._fig]
+
+        def _blit_draw(self, artists):
+            canvas = self._fig.canvas
+            if self._fig not in self._blit_cache:
+                self._blit_cache[self._fig] = (
+                    self._background_key(),
+                    canvas.copy_from_bbox(self._fig.bbox),
+                )
+            for a in artists:
+                a.axes.draw_artist(a)
+            canvas.blit(self._fig.bbox)
+
+    return PlaybackAnimation
+
+
+###############################################################################
+
+
+# Frame cache
+###############################################################################
+
+
+class FrameCache:
+    '''
+    Bounded cache of the rendered frames of interactive playback. The frames
+    of an animation never change, so once a frame has been drawn its RGBA
+    pixels are kept, and every later replay of it (each loop of the
+    animation) is copied onto the canvas instead of being updated and
+    redrawn. The least recently used frames are dropped beyond max_mb.
+
+    Each FLOW class holds one as FLOW.frame_cache, used by animations shown
+    with FLOW.frame_cache_mb set. hits and misses count the frames copied
+    from the cache and the frames drawn, and nbytes the memory held, which
+    can be used to size the cache: a frame takes width x height x 4 bytes,
+    or typically a few times less when compressed. The cache is emptied
+    whenever the canvas is resized or any axes are zoomed or panned.
+    '''
+
+    def __init__(self, max_mb=None, compress=False):
+        self.reset(max_mb, compress)
+
+    def reset(self, max_mb=None, compress=False):
+
+        """
+        Empty the cache and its counters.
+
+        Parameters
+        ----------
+
+            'max_mb' : float.
+                Memory the frames may take, in megabytes. None for no
+                limit.
+            'compress' : bool.
+                If True the frames are stored compressed with zlib, which
+                holds more frames in the same memory, at the cost of
+                compressing each new frame and decompressing each replay.
+
+        """
+
+        self.max_mb = max_mb
+        self.compress = compress
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        # Drop the frames, keeping the counters
+        self.nbytes = 0
+        self._frames = {}
+        self._view = None
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, key):
+        return key in self._frames
+
+    def get(self, key, view):
+        # Pixels of frame key as an (height, width, 4) uint8 array, or None
+        # if it is not cached. view is anything that changes the image of
+        # every frame (the canvas size and axes limits), and frames of an
+        # older view are dropped.
+        if view != self._view:
+            self.clear()
+            self._view = view
+        frame = self._frames.pop(key, None)
+        if frame is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Dictionaries keep their order of insertion, so the first frame is
+        # the least recently used
+        self._frames[key] = frame
+        shape, pixels, size = frame
+        if self.compress:
+            pixels = np.frombuffer(zlib.decompress(pixels), np.uint8)
+        return pixels.reshape(shape)
+
+    def put(self, key, rgba, view=None):
+        # Keep a copy of the pixels of frame key, dropping the least recently
+        # used frames beyond max_mb. Frames drawn for a view other than the
+        # last one looked up are not kept.
+        if view is not None and view != self._view:
+            return
+        if self.compress:
+            pixels = zlib.compress(np.ascontiguousarray(rgba), 1)
+            size = len(pixels)
+        else:
+            pixels = np.array(rgba)
+            size = pixels.nbytes
+        old = self._frames.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[2]
+        self._frames[key] = (rgba.shape, pixels, size)
+        self.nbytes += size
+
+        max_bytes = np.inf if self.max_mb is None else self.max_mb * 2 ** 20
+        while self.nbytes > max_bytes:
+            self.nbytes -= self._frames.pop(next(iter(self._frames)))[2]
+
+
+###############################################################################
+
+
+# Viewer
+###############################################################################
+
+
+class Viewer:
+    '''
+    Interactive view of a plot with a time slider and a play/pause button,
+    made by FLOW.view. The plot is drawn on demand at the time index
+    selected. While the slider is dragged only the slider is redrawn, and
+    the plot is drawn once it has rested for debounce seconds.
+
+    Frames around the index shown are drawn by a background thread on an
+    off-screen copy of the plot and kept in FLOW.frame_cache (see
+    FrameCache), looking ahead in the direction of play first. Frames found
+    there are copied to the canvas straight away, during drags and
+    playback too. The cache holds FLOW.frame_cache_mb, or by default just
+    the frames prefetched around the current one. Zooming or panning the
+    plot stops the use of cached frames until the view is restored.
+    '''
+
+    def __init__(self, flow_class, kind, time_idx=0, prefetch=8, debounce=0.1):
+        from matplotlib.widgets import Button, Slider
+
+        self.flow_class = flow_class
+        self.prefetch = prefetch
+        self.frames = flow_class.frame_indices()
+
+        # Plot at the first time index
+        self.fig, self.update = make_figure(
+            flow_class, kind, time_idx, animate=True
+        )
+        self.index = self.drawn = time_idx
+        fig = self.fig
+        canvas = fig.canvas
+        self._plot_axes = list(fig.axes)
+
+        # Controls in a strip below the plot. The panel covers the strip, so
+        # drawing it clears the controls before they are drawn again over
+        # any frame.
+        self.panel = fig.add_axes([0, 0, 1, 0.09], label="panel")
+        self.panel.set_xticks([])
+        self.panel.set_yticks([])
+        for spine in self.panel.spines.values():
+            spine.set_visible(False)
+        self.panel.set_facecolor(fig.get_facecolor())
+
+        self.slider = Slider(
+            fig.add_axes([0.15, 0.03, 0.6, 0.03]),
+            "time index",
+            0,
+            len(flow_class.time) - 1,
+            valinit=time_idx,
+            valstep=1,
+            valfmt="%d",
+        )
+        self.slider.drawon = False
+        self.slider.on_changed(lambda value: self.show(int(value)))
+        self.button = Button(fig.add_axes([0.82, 0.02, 0.1, 0.05]), "Play")
+        self.button.on_clicked(lambda event: self.toggle())
+        self.controls = [self.panel, self.slider.ax, self.button.ax]
+
+        self.playing = False
+        self._render_timer = canvas.new_timer(interval=int(debounce * 1000))
+        self._render_timer.single_shot = True
+        self._render_timer.add_callback(self.render)
+        self._play_timer = canvas.new_timer(
+            interval=max(1, int(1000 / flow_class.fps))
+        )
+        self._play_timer.add_callback(self.step)
+        canvas.mpl_connect("draw_event", self._on_draw)
+        canvas.mpl_connect("close_event", lambda event: self.close())
+
+        # Off-screen copy of the plot drawn by the background thread. The
+        # copy of the class has its own timings, so the threads do not share
+        # them.
+        self.frame_cache = flow_class.frame_cache
+        self.frame_cache.reset(
+            flow_class.frame_cache_mb, flow_class.frame_cache_compress
+        )
+        self._lock = threading.Lock()
+        self._background = make_figure(
+            copy.copy(flow_class), kind, time_idx, template=True, animate=True
+        )
+        self._home = axes_limits(self._background[0].axes)
+        self._executor = concurrent.futures.ThreadPoolExecutor(1)
+        self._generation = 0
+        self._closed = False
+        self.prefetching = None
+
+        # Only canvases drawn by Agg hold pixels that can be copied
+        self._cached = hasattr(canvas, "buffer_rgba")
+        with self._lock:
+            self.frame_cache.get(time_idx, self._view())
+        self.request_prefetch(time_idx)
+
+    def _view(self):
+        # Everything the pixels of a frame depend on besides its index
+        return (
+            tuple(self.fig.get_size_inches()),
+            self.fig.dpi,
+            axes_limits(self._plot_axes),
+        )
+
+    def _draw_controls(self):
+        for ax in self.controls:
+            self.fig.draw_artist(ax)
+        self.fig.canvas.blit(self.fig.bbox)
+
+    def _blit_cached(self, i):
+        # Show frame i from the cache, if it is there
+        if not self._cached:
+            return False
+        with self._lock:
+            frame = self.frame_cache.get(i, self._view())
+        pixels = np.asarray(self.fig.canvas.get_renderer().buffer_rgba())
+        if frame is None or frame.shape != pixels.shape:
+            return False
+        pixels[...] = frame
+        self._draw_controls()
+        return True
+
+    def show(self, i, now=False):
+
+        """
+        Show time index i, from the cache or drawn after the debounce delay.
+
+        Parameters
+        ----------
+
+            'i' : int.
+                Time index.
+            'now' : bool.
+                If True a frame that is not cached is drawn straight away.
+
+        """
+
+        self.index = i
+        if self._blit_cached(i):
+            self.request_prefetch(i)
+        elif now:
+            self.render()
+        else:
+            self._draw_controls()
+            self._render_timer.stop()
+            self._render_timer.start()
+
+    def render(self):
+        # Draw the plot at the index selected
+        i = self.index
+        with self._lock:
+            cached = self._cached and i in self.frame_cache
+        if not (cached and self._blit_cached(i)):
+            self.update(i)
+            self.drawn = i
+            self.fig.canvas.draw_idle()
+        self.request_prefetch(i)
+
+    def _on_draw(self, event):
+        # A full draw of the figure shows the plot as last drawn, which is
+        # behind the index shown if that came from the cache
+        if self.drawn != self.index and not self._blit_cached(self.index):
+            self._render_timer.stop()
+            self._render_timer.start()
+
+    def step(self):
+        # Advance to the next frame of the animation (see frame_indices),
+        # looping at the end
+        frames = self.frames
+        try:
+            k = frames.index(self.index) + 1
+        except ValueError:
+            k = 0
+        i = frames[k % len(frames)]
+        self.slider.eventson = False
+        self.slider.set_val(i)
+        self.slider.eventson = True
+        self.show(i, now=True)
+
+    def toggle(self):
+        # Play or pause
+        self.playing = not self.playing
+        self.button.label.set_text("Pause" if self.playing else "Play")
+        if self.playing:
+            self._play_timer.start()
+        else:
+            self._play_timer.stop()
+        self._draw_controls()
+
+    def request_prefetch(self, i):
+        # Have the background thread draw the frames around i, dropping any
+        # earlier request
+        if self._closed or not self._cached or self.prefetch <= 0:
+            return
+        view = self._view()
+        if self.flow_class.frame_cache_mb is None:
+            # Room for the frames around i
+            width, height = self.fig.bbox.size
+            self.frame_cache.max_mb = (
+                (2 * self.prefetch + 2) * 4 * width * height / 2 ** 20
+            )
+        self._generation += 1
+        self.prefetching = self._executor.submit(
+            self._prefetch, i, self._generation, view
+        )
+
+    def _prefetch(self, i, generation, view):
+        # Draw the frames around i in the background, nearest first and the
+        # next one in the direction of play before the previous one
+        size, dpi, limits = view
+        if limits != self._home:
+            return
+        fig, update = self._background
+        fig.set_size_inches(size)
+        fig.set_dpi(dpi)
+
+        step = self.frames.step
+        n_time = len(self.flow_class.time)
+        for k in range(2 * self.prefetch + 1):
+            j = i + step * ((k + 1) // 2) * (1 if k % 2 else -1)
+            if generation != self._generation:
+                return
+            with self._lock:
+                if not 0 <= j < n_time or j in self.frame_cache:
+                    continue
+            update(j)
+            draw_canvas(fig.canvas)
+            rgba = np.asarray(fig.canvas.buffer_rgba())
+            with self._lock:
+                self.frame_cache.put(j, rgba, view)
+
+    def close(self):
+        # Stop the timers and the background thread
+        if self._closed:
+            return
+        self._closed = True
+        self._render_timer.stop()
+        self._play_timer.stop()
+        self._generation += 1
+        self._executor.shutdown(wait=True)
+        close_figure(self._background[0])
+
+
+def axes_limits(axes):
+    # View limits of each of the axes
+    return tuple(tuple(ax.viewLim.bounds) for ax in axes)
+
+
+###############################################################################
+
+
+# Parallel rendering
+###############################################################################
+
+
+def make_figure(flow_class, kind, time_idx=0, template=False, animate=False):
+
+    # Create the figure for a plot type, returning it with its update
+    # function. With template, the figure comes from the template cache and
+    # must be handed back with close_figure. With animate, the cylinder
+    # texture moves at the same rate when frames are skipped (see
+    # FLOW.texture_phase).
+
+    if kind == "cylinders":
+        fig, ax, p, update = cylinder_figure(
+            flow_class, time_idx=time_idx, template=template, animate=animate
+        )
+    elif kind == "cylinders_3D":
+        fig, ax, cylinders, texture, update = cylinder_3D_figure(
+            flow_class, time_idx=time_idx, template=template, animate=animate
+        )
+    elif kind == "contours":
+        fig, ax, p, levels, update = contour_figure(
+            None,
+            flow_class,
+            None,
+            setup=True,
+            time_idx=time_idx,
+            template=template,
+        )
+    elif kind == "raster":
+        fig, ax, im, update = raster_figure(
+            flow_class, time_idx=time_idx, template=template
+        )
+    else:
+        raise ValueError(
+            "kind must be 'cylinders', 'cylinders_3D', 'contours' or 'raster'"
+        )
+
+    return fig, update
+
+
+def render_segment(flow_class, kind, frames, filename):
+
+    # Worker process: draw a run of consecutive frames into a lossless movie.
+
+    # Workers only save, whatever backend the parent process uses
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.animation as anim
+
+    flow_class.progress = False
+
+    fig, update = make_figure(flow_class, kind, template=True, animate=True)
+
+    # Use the same frame size the final encoder will
+    adjust_frame_size(fig, flow_class)
+
+    stats = flow_class.stats
+    writer = anim.FFMpegWriter(fps=flow_class.fps, codec="png")
+    with writer.saving(fig, filename, flow_class.dpi):
+        for i in frames:
+            update(i)
+            # Draws and encodes the frame
+            writer.grab_frame()
+            stats.lap("encode")
+            stats.end()
+
+    close_figure(fig)
+
+    return filename, stats
+
+
+def save_movie_parallel(flow_class, kind, frames, workers):
+
+    """
+    Render a movie of a FLOW class with several processes.
+
+    The frames are split into one consecutive run per worker and each worker
+    draws its own figure into a lossless temporary movie. These are then
+    joined in order and encoded once with the same settings as
+    FuncAnimation.save, so the output is frame-identical to a serial render.
+
+    Parameters
+    ----------
+
+        'flow_class' : FLOW.
+            Class holding the data and settings to render.
+        'kind' : str.
+            One of "cylinders", "cylinders_3D", "contours" or "raster".
+        'frames' : sequence of int.
+            Consecutive time indices to render.
+        'workers' : int.
+            Number of processes to use.
+
+    """
+
+    frames = list(frames)
+    chunks = [c for c in np.array_split(frames, workers) if c.size > 0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        segments = [
+            os.path.join(tmp, "segment_%04d.mkv" % i)
+            for i in range(len(chunks))
+        ]
+
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            jobs = [
+                pool.submit(
+                    render_segment,
+                    flow_class,
+                    kind,
+                    [int(i) for i in c],
+                    s,
+                )
+                for c, s in zip(chunks, segments)
+            ]
+            for n, job in enumerate(concurrent.futures.as_completed(jobs)):
+                filename, stats = job.result()
+                flow_class.stats.merge(stats)
+                if flow_class.progress:
+                    text = (
+                        "\rRendered segment "
+                        + str(n + 1)
+                        + "/"
+                        + str(len(jobs))
+                    )
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+
+        # Join the segments in order and encode them in a single pass
+        list_file = os.path.join(tmp, "segments.txt")
+        with open(list_file, "w") as f:
+            for s in segments:
+                f.write("file '%s'\n" % s)
+
+        subprocess.run(
+            [ffmpeg_path(), "-f", "concat", "-safe", "0", "-i", list_file]
+            + ["-loglevel", "error", "-r", str(flow_class.fps)]
+            + ["-vcodec", flow_class.codec]
+            + encoder_args(flow_class)
+            + ["-y", flow_class.movie_filename],
+            check=True,
+        )
+
+
+# Movie encoding
+###############################################################################
+
+
+def ffmpeg_path():
+    # ffmpeg binary, as configured for matplotlib's animation writers
+    import matplotlib.animation as anim
+
+    return anim.FFMpegWriter.bin_path()
+
+
+def encoder_args(flow_class):
+    # ffmpeg output options (after the codec) from the FLOW settings
+    import matplotlib
+
+    args = []
+    if flow_class.crf is not None:
+        args += ["-crf", str(flow_class.crf)]
+    if flow_class.pix_fmt is not None:
+        args += ["-pix_fmt", flow_class.pix_fmt]
+    return args + list(matplotlib.rcParams["animation.ffmpeg_args"])
+
+
+def adjust_frame_size(fig, flow_class):
+    # h264 and 4:2:0 chroma subsampling need even frame dimensions, so
+    # round the figure size as matplotlib's ffmpeg writer does for h264.
+    import matplotlib.animation as anim
+
+    if flow_class.codec in ("h264", "libx264") or str(
+        flow_class.pix_fmt
+    ).startswith("yuv420"):
+        w, h = fig.get_size_inches()
+        fig.set_size_inches(
+            *anim.adjusted_figsize(w, h, flow_class.dpi, 2), forward=True
+        )
+
+
+def save_movie_pipe(flow_class, fig, update, frames):
+
+    """
+    Save a movie by drawing each frame on the Agg canvas and writing its RGBA
+    buffer straight to the stdin of an ffmpeg process.
+
+    Parameters
+    ----------
+
+        'flow_class' : FLOW.
+            Class holding the movie settings (movie_filename, dpi, fps,
+            codec, crf and pix_fmt).
+        'fig' : matplotlib figure.
+            Figure created by one of the plotting functions.
+        'update' : function.
+            Update function of the figure, called with each time index.
+        'frames' : sequence of int.
+            Time indices to write.
+
+    """
+
+    canvas = movie_canvas(fig, flow_class)
+    proc = open_movie_pipe(flow_class, *canvas.get_width_height())
+    try:
+        for i in frames:
+            update(i)
+            write_movie_frame(proc, canvas, flow_class.stats)
+    except BrokenPipeError:
+        # ffmpeg has stopped, its error is raised by close_movie_pipe
+        pass
+    finally:
+        close_movie_pipe(flow_class, proc)
+
+
+def movie_canvas(fig, flow_class):
+    # Agg canvas of the figure, drawn at the resolution and frame size of
+    # the movie
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    if not isinstance(fig.canvas, FigureCanvasAgg):
+        FigureCanvasAgg(fig)
+
+    fig.set_dpi(flow_class.dpi)
+    adjust_frame_size(fig, flow_class)
+    fig.canvas.draw()
+
+    return fig.canvas
+
+
+def open_movie_pipe(flow_class, width, height):
+    # ffmpeg process encoding the raw RGBA frames written to its stdin
+    cmd = [ffmpeg_path(), "-f", "rawvideo", "-vcodec", "rawvideo"]
+    cmd += ["-s", "%dx%d" % (width, height), "-pix_fmt", "rgba"]
+    cmd += ["-r", str(flow_class.fps), "-loglevel", "error", "-i", "pipe:"]
+    cmd += ["-vcodec", flow_class.codec] + encoder_args(flow_class)
+    cmd += ["-y", flow_class.movie_filename]
+
+    return subprocess.Popen(
+        cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+
+
+def write_movie_frame(proc, canvas, stats):
+    # Draw the canvas and write its pixels to the ffmpeg process
+    draw_canvas(canvas)
+    stats.lap("draw")
+    # buffer_rgba is a view of the renderer's memory, no copy is made
+    proc.stdin.write(canvas.buffer_rgba())
+    stats.lap("encode")
+    stats.end()
+
+
+def close_movie_pipe(flow_class, proc):
+    # Finish encoding, raising an error if ffmpeg failed
+    try:
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    err = proc.stderr.read()
+    if proc.wait() != 0:
+        raise RuntimeError(
+            "ffmpeg failed to write "
+            + flow_class.movie_filename
+            + ":\n"
+            + err.decode(errors="replace")
+        )
+
+
+# Image formats save_stills can write from the pixels of the Agg canvas
+RASTER_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+
+
+def save_stills(flow_class, fig, update, indices, pattern, threads=None):
+
+    # Draw the figure at each time index on the Agg canvas and save it as a
+    # raster image (see RASTER_EXTENSIONS), the same as plt.savefig at
+    # flow_class.dpi. The images are compressed and written by a pool of
+    # threads, which release the GIL while doing so, as the next one is
+    # drawn. At most two images per thread wait to be written, which bounds
+    # the memory held in copied pixels.
+    import matplotlib.image
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    if not isinstance(fig.canvas, FigureCanvasAgg):
+        FigureCanvasAgg(fig)
+    fig.set_dpi(flow_class.dpi)
+    canvas = fig.canvas
+
+    if threads is None:
+        threads = min(4, os.cpu_count() or 1)
+    stats = flow_class.stats
+    filenames = [pattern.format(i) for i in indices]
+
+    # Pillow only knows .tif files by the name of the format
+    image_format = os.path.splitext(pattern)[1][1:].lower()
+    image_format = {"tif": "tiff"}.get(image_format, image_format)
+
+    pending = []
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        for i, filename in zip(indices, filenames):
+            update(i)
+            draw_canvas(canvas)
+            stats.lap("draw")
+
+            # The canvas is reused for the next image, so copy its pixels
+            rgba = np.array(canvas.buffer_rgba())
+            pending.append(
+                pool.submit(
+                    matplotlib.image.imsave,
+                    filename,
+                    rgba,
+                    dpi=flow_class.dpi,
+                    format=image_format,
+                )
+            )
+            if len(pending) > 2 * threads:
+                pending.pop(0).result()
+            stats.lap("encode")
+            stats.end()
+
+        for job in pending:
+            job.result()
+
+    return filenames
+
+
+###############################################################################
+
+
+# Extra functions required
+###############################################################################
+
+
+def make_cylinders(ax, n):
+    # Make stacked circles representing cylinders, from the outside in, as a
+    # single collection so they can be coloured with one set_array call.
+    from matplotlib.patches import Circle
+    from matplotlib.collections import PatchCollection
+
+    r = np.linspace(1, 0, n + 1)[:-1]
+    cylinders = []
+    for i in range(n):
+        cylinders.append(Circle([0, 0], radius=r[i]))
+
+    return PatchCollection(cylinders, ec="k", transform=ax.transData._b)
+
+
+def max_abs(data, block_size=2 ** 22):
+    # Maximum magnitude within data, read in blocks over radius so
+    # memory-mapped arrays are never loaded in full
+    block = max(1, block_size // max(1, data[0].size))
+    return max(
+        np.max(np.abs(data[i : i + block]))
+        for i in range(0, data.shape[0], block)
+    )
+
+
+def time_blocks(n_time, n_rows, block_size=2 ** 20):
+    # Slices splitting n_time time indices into blocks of about block_size
+    # values, given n_rows values are needed per time index
+    block = max(1, block_size // max(1, n_rows))
+    return [slice(i, i + block) for i in range(0, n_time, block)]
+
+
+def memmap_reference(a):
+    # File and layout from which the memory-mapped array a can be reopened,
+    # or None if a is not (a whole) memory-mapped file
+    if not isinstance(a, np.memmap) or not isinstance(a.base, mmap.mmap):
+        return None
+    order = "F" if a.flags.f_contiguous and not a.flags.c_contiguous else "C"
+    return (
+        a.filename,
+        dict(dtype=a.dtype, offset=a.offset, shape=a.shape, order=order),
+    )
+
+
+def file_hash(filename, block_size=2 ** 20):
+    # SHA-1 hash of a file, read in blocks
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def write_npy_atomic(filename, data):
+    # Save data to a .npy file, which appears complete or not at all
+    tmp = filename + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, data)
+    os.replace(tmp, filename)
+
+
+def write_text_atomic(filename, text):
+    # Write text to a file, which appears complete or not at all
+    tmp = filename + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, filename)
+
+
+def bracket(grid, values):
+    # Lower index and fractional distance to the next point on the grid
+    if grid.size == 1:
+        return np.zeros(values.size, dtype=int), np.zeros(values.size)
+    pos = np.interp(values, grid, np.arange(grid.size))
+    i = np.clip(np.floor(pos).astype(int), 0, grid.size - 2)
+    return i, pos - i
+
+
+def velocity_colours(v, flow_class):
+    # RGBA (uint8) colours of velocities v with the colour scale and
+    # colormap of flow_class
+    import matplotlib.colors
+
+    norm = matplotlib.colors.Normalize(
+        vmin=-flow_class.c_scale, vmax=flow_class.c_scale
+    )
+    return get_colormap(flow_class.cmap)(norm(v), bytes=True)
+
+
+def get_colormap(cmap, lut=None):
+    # Colormap from a name or Colormap instance, optionally resampled to lut
+    # colours
+    import matplotlib.cm
+
+    if isinstance(cmap, str):
+        return matplotlib.cm.get_cmap(cmap, lut)
+    if lut is not None:
+        return cmap.resampled(lut)
+    return cmap
+
+
+def make_cylinder_3D(radius, aspect_ratio, height):
+
+    #Define x/y positions for a 3D cylinder: the top ellipse, one side, the
+    #front half of the bottom ellipse and the other side
+
+    a = radius
+    b = a / aspect_ratio
+
+    h1, h2 = height
+
+    top = np.linspace(np.pi / 2, 5 * np.pi / 2, 40)
+    bottom = np.linspace(np.pi / 2, 3 * np.pi / 2, 20)
+
+    x = np.concatenate((a * np.sin(top), [a, a], a * np.sin(bottom), [-a, -a]))
+    y = np.concatenate(
+        (b * np.cos(top) + h2, [h2, h1], b * np.cos(bottom) + h1, [h1, h2])
+    )
+
+    return x, y
+
+
+@functools.lru_cache(maxsize=32)
+def cylinder_3D_layout(n_cylinders, aspect_ratio=1.5, shift=0.3):
+
+    """
+    Geometry of the 3D cylinder plot, which only depends on the number of
+    cylinders. Results are cached, so figures with the same number of
+    cylinders share it.
+
+    Parameters
+    ----------
+
+        'n_cylinders' : int.
+            Number of cylinders (shells).
+        'aspect_ratio' : float.
+            Ratio of the width to the height of the ellipses.
+        'shift' : float.
+            Vertical shift of the lower half, to make it more spherical.
+
+    Returns
+    -------
+
+        'outlines' : tuple of (n, 2) arrays.
+            Outline of each half cylinder in plot order: the bottom half
+            inside out, then the top half outside in.
+        'texture' : tuple.
+            (shell, theta, a, b, height, hidden) of the texture points of
+            all shells, outside in (the order they are drawn in). Each point
+            is at (a sin(th), b cos(th) + height) on top of its shell, where
+            th is theta plus the advection of the shell (its index inside
+            out). hidden is a (n_cylinders, n_hidden) boolean table of
+            whether a point on each shell, at n_hidden evenly spaced angles,
+            is hidden behind the cylinders inside it.
+
+    """
+
+    # Set properties of cylinders (heights shifted slightly)
+    radius = np.linspace(0, 1, n_cylinders + 1)
+    heights = np.sqrt(1 - radius ** 2)
+
+    # Outlines of the bottom half of sphere, in plot order
+    outlines = []
+    for i in range(1, n_cylinders + 1):
+        x, y = make_cylinder_3D(
+            radius[i], aspect_ratio, (-heights[i - 1] + shift, 0 + shift)
+        )
+        outlines.append(np.column_stack((x, y)))
+
+    # Swap order of cylinder plotting for top half
+    radius = radius[::-1]
+    heights = heights[::-1]
+    heights[0] = -heights[1] + shift
+
+    # Top half of cylinders and texture points. Each texture point stores its
+    # shell and the ellipse it lies on, so all points are placed at once.
+    shell, theta, a, b, height = [], [], [], [], []
+    for i in range(n_cylinders):
+        x, y = make_cylinder_3D(
+            radius[i], aspect_ratio, (heights[i], heights[i + 1])
+        )
+        outlines.append(np.column_stack((x, y)))
+
+        # scale texture points (x,y) to lie on top of cylinders
+        scale = radius[i] - (radius[i] - radius[i + 1]) / 2
+
+        n_dots = (2 * n_cylinders - 1) - i * 2
+        n_dots = np.max([2, n_dots])
+        shell.append(np.full(n_dots, n_cylinders - 1 - i))
+        theta.append(np.linspace(0, 2 * np.pi, n_dots + 1)[:-1])
+        a.append(np.full(n_dots, scale))
+        b.append(np.full(n_dots, scale / aspect_ratio))
+        height.append(np.full(n_dots, heights[i + 1] + 0.01))
+
+    # Texture points hidden behind the cylinders inside their own, indexed by
+    # shell inside out, same as data
+    scale = (radius[:-1] + radius[1:]) / 2
+    hidden = hidden_angles(
+        scale,
+        scale / aspect_ratio,
+        heights[1:] + 0.01,
+        radius[:-1],
+        radius[:-1] / aspect_ratio,
+        heights[:-1],
+        heights[1:],
+    )
+
+    texture = [np.concatenate(x) for x in (shell, theta, a, b, height)]
+    texture.append(hidden[::-1])
+
+    # Shared between figures, so make sure they are not changed
+    for x in outlines + texture:
+        x.setflags(write=False)
 
-        speed = self.speed
+    return tuple(outlines), tuple(texture)
 
-        movie_filename = self.movie_filename
-        image_filename = self.image_filename
-        dpi = self.dpi
-        fps = self.fps
 
-        # Check if progress needs to be written to screen for saving
-        if save:
-            self.progress = True
-        else:
-            self.progress = False
+@functools.lru_cache(maxsize=32)
+def cylinder_dots(n_cylinders):
+    # Texture dots of the 2D cylinder plot, inside out: the shell of each dot
+    # and its angle before advection. Shell i has 2i + 1 evenly spaced dots
+    # (at least 2). Cached, and shared between figures, so read-only.
+    n_dots = np.maximum(2, 2 * np.arange(n_cylinders) + 1)
+    shell = np.repeat(np.arange(n_cylinders), n_dots)
+    first = np.repeat(np.cumsum(n_dots) - n_dots, n_dots)
+    th = (np.arange(shell.size) - first) * (2 * np.pi / n_dots)[shell]
 
-        # Set up and plot the first figure
-        fig, ax, p, levels, update = contour_figure(
-            None, self, None, setup=True, time_idx=time_idx
-        )
+    shell.setflags(write=False)
+    th.setflags(write=False)
+    return shell, th
 
-        # Animate the figure if needed
-        if animate:
-            frames = int(len(time))
-            self.ani = anim.FuncAnimation(
-                fig,
-                update,
-                frames=frames,
-                interval=10,
-                blit=False,
-                repeat=True,
-            )
 
-            print("\nAnimating...")
+def resample_theta(data, th_resolution, method="linear"):
 
-            # Save the animation into a movie if needed
-            if save:
+    """
+    Resample a (radius, theta, time) array onto th_resolution points spanning
+    [0, 2pi] in theta, operating on the whole array at once.
 
-                print(
-                    "Saving file "
-                    + movie_filename
-                    + " at "
-                    + str(dpi)
-                    + "dpi and "
-                    + str(fps)
-                    + "fps"
-                )
-                self.ani.save(
-                    movie_filename, dpi=dpi, fps=fps, writer="ffmpeg"
-                )
-                print("\nSAVED")
+    Parameters
+    ----------
 
-            else:
-                plt.show()
+        'data' : 3D numpy array.
+            Data with theta along the second axis, assumed to be sampled on
+            np.linspace(0, 2*pi, data.shape[1]).
+        'th_resolution' : int.
+            Number of points in theta to resample onto.
+        'method' : str.
+            "linear" gives identical results to np.interp applied to each
+            (radius, time) pair. "periodic" takes the point at 2pi to be a
+            repeat of the one at 0, and interpolates across the wrap towards
+            the first point so the result is exactly periodic. "nearest"
+            takes the closest input point.
 
-        # Save the plot as a picture if needed
-        elif save:
-            print("Saving file " + image_filename + " at " + str(dpi) + "dpi")
-            plt.savefig(image_filename, dpi=dpi)
-            print("\nSAVED")
+    Returns
+    -------
 
-        # Plot the figure if not animating or saving
-        else:
-            plt.show()
+        3D float numpy array of shape (radius, th_resolution, time)
 
+    """
 
-###############################################################################
+    n = data.shape[1]
+    theta = np.linspace(0, 2 * np.pi, th_resolution)
 
+    if method == "nearest":
+        theta_old = np.linspace(0, 2 * np.pi, n)
+        idx = np.abs(theta[:, np.newaxis] - theta_old).argmin(axis=1)
+        return np.take(data, idx, axis=1).astype(float, copy=False)
 
-# Extra functions required
-###############################################################################
+    elif method == "linear":
+        theta_old = np.linspace(0, 2 * np.pi, n)
+        wrap = np.arange(n)
 
+    elif method == "periodic":
+        # The grid is closed, so the last point duplicates the first. It is
+        # dropped and the first point used across the wrap instead.
+        theta_old = np.linspace(0, 2 * np.pi, n)
+        wrap = np.append(np.arange(n - 1), 0)
 
-def make_cylinders(ax, n):
-    # Make stacked circles representing cylinders.
-    r = np.linspace(1, 0, n + 1)[:-1]
-    cylinders = []
-    for i in range(n):
-        cylinders.append(
-            plt.Circle([0, 0], radius=r[i], ec="k", transform=ax.transData._b)
+    else:
+        raise ValueError(
+            "th_interpolation must be 'linear', 'periodic' or 'nearest'"
         )
 
-    return cylinders
+    if theta_old.size == 1:
+        return np.repeat(data.astype(float), th_resolution, axis=1)
+
+    # Bracketing points on the old grid, chosen as np.interp does.
+    lo = np.searchsorted(theta_old, theta, side="right") - 1
+    lo = np.clip(lo, 0, theta_old.size - 2)
+    dx = (theta - theta_old[lo])[np.newaxis, :, np.newaxis]
+    step = (theta_old[lo + 1] - theta_old[lo])[np.newaxis, :, np.newaxis]
+
+    temp = np.empty((data.shape[0], th_resolution, data.shape[2]))
+    end = theta == theta_old[-1]
+
+    # Work through radius in blocks small enough to stay in cache
+    block = max(1, 2 ** 17 // max(1, th_resolution * data.shape[2]))
+    for i in range(0, data.shape[0], block):
+        chunk = np.asarray(data[i : i + block], dtype=float)
+        out = temp[i : i + block]
+
+        # slope * (theta - theta_old) + lower value, in the same order of
+        # operations as np.interp so results match exactly.
+        lower = np.take(chunk, wrap[lo], axis=1)
+        np.take(chunk, wrap[lo + 1], axis=1, out=out)
+        out -= lower
+        out /= step
+        out *= dx
+        out += lower
+
+        # np.interp returns the final point exactly
+        out[:, end, :] = np.take(chunk, wrap[-1:], axis=1)
+
+    return temp
+
+
+def hidden_angles(a_t, b_t, height, a, b, h1, h2, n=720):
+    # Tabulate which texture points on the ellipses (a_t sin(th), b_t cos(th)
+    # + height) of each shell are hidden behind any of the 3D cylinders
+    # inside it, at n evenly spaced angles th. The cylinders have radii a,
+    # ellipse minor axes b and lower/upper heights h1/h2 (as drawn by
+    # make_cylinder_3D), outside in, and shell i lies on cylinder i. Returns
+    # an (n_shells, n) table, outside in. Look up with hidden_index.
+    th = np.arange(n) * 2 * np.pi / n
+    x = a_t[:, np.newaxis] * np.sin(th)
+    y = b_t[:, np.newaxis] * np.cos(th) + height[:, np.newaxis]
+
+    def edge(k):
+        # Half height of the ellipse of cylinder k at x
+        return b[k] * np.sqrt(np.clip(1 - (x / a[k]) ** 2, 0, None))
+
+    # The cylinders inside shell i that are wider than a point are i + 1 up
+    # to last. Each starts where the one outside it ends, so together they
+    # cover one interval in y: from the bottom of cylinder i + 1 to the
+    # highest of their tops. The tops are concave in the radius, so the
+    # highest is found by bisection rather than testing every cylinder.
+    last = a.size - 1 - np.searchsorted(a[::-1], np.abs(x), side="right")
+    first = np.arange(a.size)[:, np.newaxis] + 1
+    covered = last >= first
+    lo = np.where(covered, first, last)
+    hi = last.copy()
+    while np.any(lo < hi):
+        mid = (lo + hi) // 2
+        after = np.minimum(mid + 1, hi)
+        rising = h2[mid] + edge(mid) < h2[after] + edge(after)
+        lo = np.where(rising, mid + 1, lo)
+        hi = np.where(rising, hi, mid)
+    first = np.minimum(first, a.size - 1)
+    bottom = h1[first] - edge(first)
+    top = h2[lo] + edge(lo)
+    return covered & (y > bottom) & (y < top)
+
+
+def hidden_index(theta, n=720):
+    # Index of the nearest angle tabulated by hidden_angles
+    i = np.rint(np.mod(theta, 2 * np.pi) * n / (2 * np.pi)).astype(int)
+    return i % n
+
+
+def has_display():
+    # Whether figures can be shown on screen. Only X11 and Wayland sessions
+    # can be missing a display.
+    if sys.platform.startswith("linux"):
+        return bool(
+            os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")
+        )
+    return True
 
 
-def make_cylinder_3D(radius, aspect_ratio, height):
+def select_backend():
 
-    #Define x/y positions for a 3D cylinder
+    # Use the non-interactive Agg backend for plots made without a display,
+    # unless a backend has been chosen by the user (MPLBACKEND, matplotlibrc
+    # or matplotlib.use) or pyplot is already imported. This skips
+    # matplotlib's search for an interactive backend and works on
+    # display-less nodes. The choice is never undone, as switching backends
+    # closes the open figures.
 
-    a = radius
-    b = a / aspect_ratio
+    if has_display() or "matplotlib.pyplot" in sys.modules:
+        return
+    if os.environ.get("MPLBACKEND"):
+        return
+    import matplotlib
 
-    h1, h2 = height
+    # The backend of a copy is not resolved, unlike rcParams["backend"]
+    default = matplotlib.rcParamsDefault["backend"]
+    if matplotlib.rcParams.copy()["backend"] is default:
+        matplotlib.use("Agg")
 
-    theta = np.linspace(np.pi / 2, 5 * np.pi / 2, 40)
-    x = a * np.sin(theta)
-    y = b * np.cos(theta) + h2
 
-    x = np.append(x, [a, a])
-    y = np.append(y, [h2, h1])
+def make_title(fig, ax):
 
-    theta = np.linspace(np.pi / 2, 3 * np.pi / 2, 20)
-    for i in range(theta.size):
-        x = np.append(x, a * np.sin(theta[i]))
-        y = np.append(y, b * np.cos(theta[i]) + h1)
+    # Create the title of ax as a text artist in its own invisible axes
+    # above ax. Blitting only redraws within the axes of each artist, so the
+    # title can then be updated along with the data. It is placed where
+    # ax.set_title would put it.
 
-    x = np.append(x, [-a, -a])
-    y = np.append(y, [h1, h2])
+    import matplotlib
 
-    return x, y
+    pos = ax.get_position()
+    title_ax = fig.add_axes([0, pos.y1, 1, 1 - pos.y1], label="title")
+    title_ax.axis("off")
 
+    transform = matplotlib.transforms.offset_copy(
+        ax.transAxes,
+        fig=fig,
+        y=matplotlib.rcParams["axes.titlepad"],
+        units="points",
+    )
+    title_text = title_ax.text(
+        0.5,
+        1.0,
+        "",
+        transform=transform,
+        ha="center",
+        va="baseline",
+        fontsize=matplotlib.rcParams["axes.titlesize"],
+        fontweight=matplotlib.rcParams["axes.titleweight"],
+    )
 
-def create_texture_func(theta, a, b, height):
-    def func(theta):
-        x = a * np.sin(theta)
-        y = b * np.cos(theta) + height
-        return x, y
+    # Keep ax as the current axes for any further pyplot calls
+    fig.sca(ax)
 
-    return func
+    return title_text
 
 
-def setup_polar_fig():
+def setup_polar_fig(template=False):
     # Set up a figure in polar co-ordinates
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection="polar"))
+    fig = new_figure(template)
+    ax = fig.add_subplot(projection="polar")
     ax.set_xticks([])
     ax.set_yticks([])
     ax.set_theta_offset(0.5 * np.pi)
@@ -459,7 +2762,9 @@ def setup_polar_fig():
     return fig, ax
 
 
-def contour_figure(ax, flow_class, levels, setup=False, time_idx=0):
+def contour_figure(
+    ax, flow_class, levels, setup=False, time_idx=0, template=False
+):
 
     # Set up the figure for contour plotting the data
 
@@ -469,8 +2774,9 @@ def contour_figure(ax, flow_class, levels, setup=False, time_idx=0):
     theta = flow_class.theta
     time = flow_class.time
 
-    speed = flow_class.speed
     progress = flow_class.progress
+    frames = flow_class.frame_indices()
+    stats = flow_class.stats
 
     title = flow_class.title
     colorbar_title = flow_class.colorbar_title
@@ -479,48 +2785,78 @@ def contour_figure(ax, flow_class, levels, setup=False, time_idx=0):
 
     if setup:
 
-        # Create the figure and axes
-        fig, ax = setup_polar_fig()
+        def build():
+            # Static content of the figure, kept in the template
 
-        # Set min/max data values for colorbar (such that it is symmetric)
-        levels = np.linspace(-c_scale, c_scale, 60)  # Contour levels
+            # Create the figure and axes
+            fig, ax = setup_polar_fig(template)
 
-        # Plot the first figure
-        p = [contour_figure(ax, flow_class, levels, time_idx=time_idx)]
-        ax.autoscale(False)
+            # Set min/max data values for colorbar (such that it is
+            # symmetric)
+            levels = np.linspace(-c_scale, c_scale, 60)  # Contour levels
 
-        c_ticks = np.linspace(
-            levels[0], levels[-1], 5
-        )  # Tick values for colourbar.
+            # Plot the first figure
+            p = [contour_figure(ax, flow_class, levels, time_idx=time_idx)]
+            ax.autoscale(False)
 
-        cbar = plt.colorbar(p[0][0], ax=ax, ticks=c_ticks)
-        cbar.ax.set_title(colorbar_title, y=1.1)
-        pos = cbar.ax.get_position()
-        cbar.ax.set_position(
-            [pos.x0 + 0.05, pos.y0 * 2, pos.width, pos.height / 2]
+            c_ticks = np.linspace(
+                levels[0], levels[-1], 5
+            )  # Tick values for colourbar.
+
+            cbar = fig.colorbar(p[0][0], ax=ax, ticks=c_ticks)
+            cbar.ax.set_title(colorbar_title, y=1.1)
+            pos = cbar.ax.get_position()
+            cbar.ax.set_position(
+                [pos.x0 + 0.05, pos.y0 * 2, pos.width, pos.height / 2]
+            )
+
+            title_text = make_title(fig, ax)
+
+            return dict(
+                fig=fig,
+                ax=ax,
+                p=p,
+                levels=levels,
+                title_text=title_text,
+                layers=[ax, title_text],
+            )
+
+        t = get_template(
+            template_key("contours", flow_class), build, template
         )
+        fig, ax, p, levels = t["fig"], t["ax"], t["p"], t["levels"]
+        title_text = t["title_text"]
+
+        # The contours of a template are of the last render
+        if not t["fresh"]:
+            for tp in p[0][0].collections:
+                tp.remove()
+            p[0] = contour_figure(ax, flow_class, levels, time_idx=time_idx)
+        title_text.set_text("")
 
         ########
         def update(i):
             # Update function for animation
 
             # print progess if saving.
-            if progress:
-                text = (
-                    "\rSaving frame " + str(i + 1) + "/" + str(data.shape[2])
-                )
+            if progress and i in frames:
+                n = frames.index(i) + 1
+                text = "\rSaving frame " + str(n) + "/" + str(len(frames))
                 sys.stdout.write(text)
                 sys.stdout.flush()
 
+            stats.start(i)
+
             # Remove the existing contours
             for tp in p[0][0].collections:
                 tp.remove()
 
             # Update the plot
             p[0] = contour_figure(ax, flow_class, levels, time_idx=i)
-            plt.title(title % time[i])
+            title_text.set_text(title % time[i])
+            stats.lap("update")
 
-            return p
+            return p[0][0].collections + [ax.spines["polar"], title_text]
 
         #########
 
@@ -530,311 +2866,495 @@ def contour_figure(ax, flow_class, levels, setup=False, time_idx=0):
 
         # Grid radius and theta
         THETA, R = np.meshgrid(theta, radius)
+        z = data[:, :, time_idx]
+        flow_class.stats.lap("data")
 
         # Plot the contours
         return [
-            ax.contourf(THETA, R, data[:, :, time_idx], levels, cmap="jet")
+            ax.contourf(
+                THETA,
+                R,
+                z,
+                levels,
+                cmap=get_colormap(flow_class.cmap),
+            )
         ]
 
 
-def cylinder_figure(flow_class, time_idx=0):
+def polar_raster_map(radius, theta, n_pixels):
+
+    """
+    Precompute how to fill a square image covering the polar axes from one
+    (radius, theta) slice of data by bilinear interpolation.
+
+    Parameters
+    ----------
+
+        'radius' : 1D numpy array.
+            Radial grid of the data.
+        'theta' : 1D numpy array.
+            Theta grid of the data.
+        'n_pixels' : int.
+            Width and height of the image.
+
+    Returns
+    -------
+
+        'idx' : (4, n_pixels**2) int array.
+            Flattened (radius, theta) indices of the 4 surrounding points of
+            each pixel. Pixels outside the data point one past the end of
+            the flattened slice.
+        'weights' : (4, n_pixels**2) float array.
+            Bilinear weights of those points.
+
+    """
+
+    # Pixel centres in the (-1, 1) square the polar axes are drawn in
+    x = (np.arange(n_pixels) + 0.5) / n_pixels * 2 - 1
+    X, Y = np.meshgrid(x, x)
+    R = np.hypot(X, Y).ravel()
+
+    # Theta is measured clockwise from vertical (see setup_polar_fig)
+    TH = np.mod(0.5 * np.pi - np.arctan2(Y, X), 2 * np.pi).ravel()
+
+    i, wr = bracket(radius, R)
+    j, wt = bracket(theta, TH)
+    i1 = np.minimum(i + 1, radius.size - 1)
+    j1 = np.minimum(j + 1, theta.size - 1)
+
+    n = theta.size
+    idx = np.stack((i * n + j, i * n + j1, i1 * n + j, i1 * n + j1))
+    weights = np.stack(
+        ((1 - wr) * (1 - wt), (1 - wr) * wt, wr * (1 - wt), wr * wt)
+    )
+    outside = (R < radius[0]) | (R > radius[-1])
+    idx[:, outside] = radius.size * n
+    weights[:, outside] = 0.25
+
+    return idx, weights
+
+
+@functools.lru_cache(maxsize=None)
+def raster_image():
+
+    # Image of raster_figure, defined on first use as matplotlib is imported
+    # lazily. The image is made with one pixel per pixel of the saved axes,
+    # so when it is drawn at that size it is handed to the renderer as it
+    # is, rather than resampled by matplotlib (which also converts it to
+    # floats and back). At any other size it is resampled as usual.
+
+    import matplotlib.image
+
+    class RasterImage(matplotlib.image.BboxImage):
+        def make_image(self, renderer, magnification=1.0, unsampled=False):
+            bbox = self.get_window_extent(renderer)
+            size = (np.ceil(bbox.height), np.ceil(bbox.width))
+            if magnification != 1 or self._A.shape[:2] != size:
+                return super().make_image(renderer, magnification, unsampled)
+            return self._A, bbox.x0, bbox.y0, None
+
+    return RasterImage
+
+
+def raster_figure(flow_class, time_idx=0, template=False):
+
+    import matplotlib
 
     # Read in variables from flow_class
     data = flow_class.data
     radius = flow_class.radius
+    theta = flow_class.theta
     time = flow_class.time
 
-    speed = flow_class.speed
     progress = flow_class.progress
+    frames = flow_class.frame_indices()
+    stats = flow_class.stats
 
     title = flow_class.title
     colorbar_title = flow_class.colorbar_title
 
     c_scale = flow_class.c_scale
 
-    # Create the figure and axes
-    fig, ax = setup_polar_fig()
+    # Same levels as contour_figure. The levels are evenly spaced, so a
+    # colormap with one colour per band gives the same banding.
+    levels = np.linspace(-c_scale, c_scale, 60)
+    n_bands = levels.size - 1
 
-    n_cylinders = radius.size - 1
+    def build():
+        # Static content of the figure, kept in the template
+
+        # Create the figure and axes
+        fig, ax = setup_polar_fig(template)
+
+        cmap = get_colormap(flow_class.cmap, n_bands)
+        norm = matplotlib.colors.Normalize(vmin=-c_scale, vmax=c_scale)
+        sm = matplotlib.cm.ScalarMappable(cmap=cmap, norm=norm)
+        sm.set_array([])
+
+        c_ticks = np.linspace(
+            levels[0], levels[-1], 5
+        )  # Tick values for colourbar.
 
-    # Create cylinders
-    cylinders = make_cylinders(ax, n_cylinders)
-    for c in cylinders:
-        ax.add_artist(c)
-    p = [cylinders]
-
-    # Set min/max data values for colorbar (such that it is symmetric)
-    levels = np.linspace(-c_scale, c_scale, 60)  # Contour levels
-
-    # Create colorbar based on data range
-    cmap = plt.cm.get_cmap("jet")
-    c_ticks = np.linspace(
-        levels[0], levels[-1], 5
-    )  # Tick values for colourbar.
-    ax.autoscale(False)
-
-    norm = matplotlib.colors.Normalize(vmin=-c_scale, vmax=c_scale)
-    sm = matplotlib.cm.ScalarMappable(cmap=cmap, norm=norm)
-    sm.set_array([])
-    cbar = plt.colorbar(sm, ticks=c_ticks)
-    cbar.ax.set_title(colorbar_title, y=1.1)
-    pos = cbar.ax.get_position()
-    cbar.ax.set_position(
-        [pos.x0 + 0.05, pos.y0 * 2, pos.width, pos.height / 2]
+        cbar = fig.colorbar(sm, ax=ax, ticks=c_ticks)
+        cbar.ax.set_title(colorbar_title, y=1.1)
+        pos = cbar.ax.get_position()
+        cbar.ax.set_position(
+            [pos.x0 + 0.05, pos.y0 * 2, pos.width, pos.height / 2]
+        )
+
+        # One image pixel per output pixel of the axes when saved, once the
+        # axes has been made square
+        ax.apply_aspect()
+        n_pixels = int(np.ceil(ax.bbox.width * flow_class.dpi / fig.dpi))
+        idx, weights = polar_raster_map(radius, theta, n_pixels)
+
+        # Only the pixels inside the data are computed, the rest stay clear.
+        # Single precision places values within a tiny fraction of a band.
+        inside = np.flatnonzero(idx[0] < radius.size * theta.size)
+        idx, weights = idx[:, inside], weights[:, inside].astype(np.float32)
+
+        # RGBA of each band as one uint32, with transparent entries either
+        # side for values outside the levels (left unfilled by contourf).
+        # The top band is repeated so values equal to c_scale are included.
+        lut = np.zeros((n_bands + 3, 4), dtype=np.uint8)
+        lut[1:-2] = cmap(np.arange(n_bands), bytes=True)
+        lut[-2] = lut[-3]
+        lut = lut.view(np.uint32).ravel()
+
+        # The image covers the axes and is clipped to the circle. It is not
+        # an AxesImage, which matplotlib draws into the blitting background
+        # even when animated.
+        im = raster_image()(ax.bbox, interpolation="nearest", origin="lower")
+        im.set_data(np.zeros((n_pixels, n_pixels, 4), dtype=np.uint8))
+        ax.add_artist(im)
+        im.set_clip_path(ax.patch)
+        ax.autoscale(False)
+
+        title_text = make_title(fig, ax)
+
+        return dict(
+            fig=fig,
+            ax=ax,
+            im=im,
+            raster_map=(n_pixels, inside, idx, weights, lut),
+            title_text=title_text,
+            layers=[im, ax.spines["polar"], title_text],
+        )
+
+    t = get_template(
+        template_key("raster", flow_class, radius, theta, flow_class.dpi),
+        build,
+        template,
     )
+    fig, ax, im, title_text = t["fig"], t["ax"], t["im"], t["title_text"]
+    n_pixels, inside, idx, weights, lut = t["raster_map"]
 
-    # Set colours of cylinders
-    for j, c in enumerate(p[0]):
-        j = data.shape[0] - (
-            j + 2
-        )  # so that j corresponds to direction the data iterates
-        c.set_facecolor(
-            cmap(
-                0.5
-                * (
-                    1
-                    + ((data[j + 1, 0, time_idx] + data[j, 0, time_idx]) / 2)
-                    / c_scale
-                )
-            )[:-1]
+    def frame(i):
+        # Position of the time slice in lut, from the contour band each
+        # value falls in. The bilinear weights sum to one, so interpolating
+        # these onto the pixels inside the data gives the band of each pixel.
+        values = np.ravel(data[:, :, i]).astype(np.float32)
+        values *= n_bands / (2 * c_scale)
+        values += n_bands / 2 + 1
+        values = np.einsum("ij,ij->j", values[idx], weights)
+
+        # Values outside the levels (and NaN) take the clear ends of lut
+        rgba = np.zeros(n_pixels * n_pixels, dtype=np.uint32)
+        rgba[inside] = lut[np.clip(values.astype(np.intp), 0, n_bands + 2)]
+
+        return rgba.view(np.uint8).reshape(n_pixels, n_pixels, 4)
+
+    im.set_data(frame(time_idx))
+    title_text.set_text("")
+
+    ########
+    def update(i):
+        # Update function for animation
+
+        # print progess if saving.
+        if progress and i in frames:
+            n = frames.index(i) + 1
+            text = "\rSaving frame " + str(n) + "/" + str(len(frames))
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+        stats.start(i)
+        rgba = frame(i)
+        stats.lap("data")
+
+        im.set_data(rgba)
+        title_text.set_text(title % time[i])
+        stats.lap("update")
+
+        return [im, ax.spines["polar"], title_text]
+
+    #########
+
+    return fig, ax, im, update
+
+
+def cylinder_figure(flow_class, time_idx=0, template=False, animate=False):
+
+    import matplotlib
+
+    # Read in variables from flow_class
+    radius = flow_class.radius
+    time = flow_class.time
+
+    progress = flow_class.progress
+    frames = flow_class.frame_indices()
+    stats = flow_class.stats
+
+    title = flow_class.title
+    colorbar_title = flow_class.colorbar_title
+
+    c_scale = flow_class.c_scale
+
+    n_cylinders = radius.size - 1
+
+    def build():
+        # Static content of the figure, kept in the template
+
+        # Create the figure and axes
+        fig, ax = setup_polar_fig(template)
+
+        # Create cylinders
+        cylinders = make_cylinders(ax, n_cylinders)
+        ax.add_artist(cylinders)
+
+        # Set min/max data values for colorbar (such that it is symmetric)
+        levels = np.linspace(-c_scale, c_scale, 60)  # Contour levels
+
+        # Create colorbar based on data range
+        cmap = get_colormap(flow_class.cmap)
+        c_ticks = np.linspace(
+            levels[0], levels[-1], 5
+        )  # Tick values for colourbar.
+        ax.autoscale(False)
+
+        norm = matplotlib.colors.Normalize(vmin=-c_scale, vmax=c_scale)
+        sm = matplotlib.cm.ScalarMappable(cmap=cmap, norm=norm)
+        sm.set_array([])
+        cbar = fig.colorbar(sm, ax=ax, ticks=c_ticks)
+        cbar.ax.set_title(colorbar_title, y=1.1)
+        pos = cbar.ax.get_position()
+        cbar.ax.set_position(
+            [pos.x0 + 0.05, pos.y0 * 2, pos.width, pos.height / 2]
         )
 
+        # Create dots at the center radii of the cyclinders
+        shell, th = cylinder_dots(n_cylinders)
+        r = ((radius[1:] + radius[:-1]) / 2)[shell]
+        dots = ax.plot([], [], "ko", markersize=3)
+
+        title_text = make_title(fig, ax)
+
+        return dict(
+            fig=fig,
+            ax=ax,
+            cylinders=cylinders,
+            dots=dots,
+            dot_layout=(r, th, shell),
+            title_text=title_text,
+            layers=[ax, title_text],
+        )
 
+    t = get_template(
+        template_key("cylinders", flow_class, radius), build, template
+    )
+    fig, ax, cylinders = t["fig"], t["ax"], t["cylinders"]
+    r, th, shell = t["dot_layout"]
+    title_text = t["title_text"]
+    p = [cylinders, t["dots"]]
 
-    # Create dots at the center radii of the cyclinders
-    r = np.zeros(0)
-    th = np.zeros(0)
-    for i in range(n_cylinders):
-        r_cyl = (radius[i] + radius[i + 1]) / 2
-        n_dots = np.max([2, 2 * (i + 1) - 1])
-        r = np.append(r, r_cyl * np.ones(n_dots))
-        th = np.append(th, np.linspace(0, 2 * np.pi, n_dots + 1)[:-1])
+    # Set colours of cylinders by the velocity at the middle of each shell,
+    # looked up for every frame at once. Circles iterate from outside in,
+    # whereas data iterates inside out.
+    colours = flow_class.shell_colours()[::-1]
+    cylinders.set_facecolor(colours[:, time_idx] / 255)
 
-    texture = np.column_stack((r, th))
+    # Texture is advected by the displacement of its shell at each frame
+    phase = flow_class.texture_phase(animate)
+    p[-1][0].set_data(th + phase[shell, time_idx], r)
 
-    p.append(ax.plot(texture[:, 1], texture[:, 0], "ko", markersize=3))
+    title_text.set_text("")
 
     # Define the update function for animation
     ########
     def update(i):
 
         # print progess to screen if saving every 10 frames
-        if progress:
-            text = "\rSaving frame " + str(i + 1) + "/" + str(data.shape[2])
+        if progress and i in frames:
+            n = frames.index(i) + 1
+            text = "\rSaving frame " + str(n) + "/" + str(len(frames))
             sys.stdout.write(text)
             sys.stdout.flush()
 
-        cmap = plt.cm.get_cmap("jet")
+        stats.start(i)
+        c = colours[:, i] / 255
+        th_i = th + phase[shell, i]
+        stats.lap("data")
 
         # Set colors of circles by data
-        for j, c in enumerate(p[0]):
-            # circles iterate from outside in, whereas data iterates inside out
-            j = data.shape[0] - (j + 2)
-            c.set_facecolor(
-                cmap(
-                    0.5
-                    * (1 + ((data[j + 1, 0, i] + data[j, 0, i]) / 2) / c_scale)
-                )[:-1]
-            )
+        cylinders.set_facecolor(c)
 
-        plt.title(title % time[i])
+        title_text.set_text(title % time[i])
 
         # Advect the texture
-        factor = 100
-        texture[:, 1] = (
-            texture[:, 1]
-            - np.interp(texture[:, 0], radius, data[:, 0, i]) * speed / factor
-        )
-        p[-1][0].set_data(texture[:, 1], texture[:, 0])
+        p[-1][0].set_data(th_i, r)
+        stats.lap("update")
 
-        return p
+        return [cylinders] + p[-1] + [ax.spines["polar"], title_text]
 
     #########
 
     return fig, ax, p, update
 
 
-def cylinder_3D_figure(flow_class, time_idx=0):
+def cylinder_3D_figure(flow_class, time_idx=0, template=False, animate=False):
+
+    import matplotlib
 
     # Read in variables from flow_class
-    data = flow_class.data
     radius = flow_class.radius
     time = flow_class.time
 
-    speed = flow_class.speed
     progress = flow_class.progress
+    frames = flow_class.frame_indices()
+    stats = flow_class.stats
 
     title = flow_class.title
     colorbar_title = flow_class.colorbar_title
 
     c_scale = flow_class.c_scale
 
-    # Create the figure and axes
-    fig, ax = plt.subplots()
-    plt.axis("off")
-    plt.axis("square")
-    ax.grid(False)
-    plt.xlim(-1.01, 1.1)
-    plt.ylim(-1, 1.4)
-    # ax.set_position([-0.6,-0.15,1.5,1.3])
-
-    #####################
-    # Create cylinders
-    #####################
-
     # Number
     n_cylinders = radius.size - 1
 
-    # Set properties of cylinders (heights shifted slightly)
-    aspect_ratio = 1.5
-    radius = np.linspace(0, 1, n_cylinders + 1)
-    heights = np.sqrt(1 - radius ** 2)
-    shift = (
-        0.3
-    )  # vertical shift in y axis to lower half to make more spherical
-    # Plot bottom half of sphere, setting plot order
-    order = 1
-    top, bottom = [], []
-    for i in range(1, n_cylinders + 1):
-        x, y = make_cylinder_3D(
-            radius[i], aspect_ratio, (-heights[i - 1] + shift, 0 + shift)
-        )
-        bottom.append(
-            plt.gca().add_patch(
-                plt.Polygon(np.column_stack((x, y)), zorder=order)
-            )
-        )
-        order += 1
-        plt.plot(x, y, "-k", lw=1, zorder=order)  # plot edges
-        order += 1
-
-    # Swap order of cylinder plotting for top half
-    radius = radius[::-1]
-    heights = heights[::-1]
-    heights[0] = -heights[1] + shift
+    def build():
+        # Static content of the figure, kept in the template
 
-    # Initialise lists for texture function and plotted line objects and
-    # anglular position (theta)
-    texture_funcs = []
-    texture_plots = []
-    texture_theta = []
-    # Plot top half of cylinders and texture points in correct order
-    for i in range(n_cylinders):
-        x, y = make_cylinder_3D(
-            radius[i], aspect_ratio, (heights[i], heights[i + 1])
-        )
-        top.append(
-            plt.gca().add_patch(
-                plt.Polygon(np.column_stack((x, y)), zorder=order)
-            )
+        # Create the figure and axes
+        fig = new_figure(template)
+        ax = fig.add_subplot()
+        ax.axis("off")
+        ax.axis("square")
+        ax.grid(False)
+        ax.set_xlim(-1.01, 1.1)
+        ax.set_ylim(-1, 1.4)
+        # ax.set_position([-0.6,-0.15,1.5,1.3])
+
+        #####################
+        # Create cylinders
+        #####################
+
+        # Outlines and texture layout, inside out
+        outlines, texture = cylinder_3D_layout(n_cylinders)
+
+        # plot texture points of all shells as one line of markers, drawn
+        # above all cylinders. Points are drawn in the order given, which is
+        # outside in.
+        (texture_line,) = ax.plot([], [], "ok", markersize=2.3)
+
+        # All cylinders in one collection. Faces and edges are drawn path by
+        # path in the order above, bottom half first. The outlines are left
+        # open so the edge is not drawn across the top face.
+        cylinders = matplotlib.collections.PolyCollection(
+            outlines, closed=False, edgecolors="k", linewidths=1
         )
-        order += 1
-        plt.plot(x, y, "-k", lw=1, zorder=order)  # plot edges
-        order += 1
+        ax.add_collection(cylinders, autolim=False)
 
-        # scale texture points (x,y) to lie on top of cylinders
-        scale = radius[i] - (radius[i] - radius[i + 1]) / 2
+        # Set min/max data values for colorbar (such that it is symmetric)
+        levels = np.linspace(-c_scale, c_scale, 60)  # Contour levels
 
-        # Create a function that generates (x,y) for each cylinders texture
-        # points.
-        n_dots = (2 * n_cylinders - 1) - i * 2
-        n_dots = np.max([2, n_dots])
-        texture_theta.append(np.linspace(0, 2 * np.pi, n_dots + 1)[:-1])
-        texture_funcs.append(
-            create_texture_func(
-                texture_theta[-1],
-                scale,
-                scale / aspect_ratio,
-                heights[i + 1] + 0.01,
-            )
-        )
+        # Create colorbar based on data range
+        cmap = get_colormap(flow_class.cmap)
+        c_ticks = np.linspace(
+            levels[0], levels[-1], 5
+        )  # Tick values for colourbar.
+        ax.autoscale(False)
 
-        # plot texture points
-        x_t, y_t = texture_funcs[-1](texture_theta[-1])
-        texture_plots.append(
-            plt.plot(x_t, y_t, "ok", markersize=2.3, zorder=order)
+        norm = matplotlib.colors.Normalize(vmin=-c_scale, vmax=c_scale)
+        sm = matplotlib.cm.ScalarMappable(cmap=cmap, norm=norm)
+        sm.set_array([])
+        cbar = fig.colorbar(sm, ax=ax, ticks=c_ticks)
+        cbar.ax.set_title(colorbar_title, y=1.1)
+        pos = cbar.ax.get_position()
+        cbar.ax.set_position(
+            [pos.x0 + 0.05, pos.y0 * 2, pos.width, pos.height / 2]
         )
-        order += 1
 
-    # Set min/max data values for colorbar (such that it is symmetric)
-    levels = np.linspace(-c_scale, c_scale, 60)  # Contour levels
+        title_text = make_title(fig, ax)
 
-    # Create colorbar based on data range
-    cmap = plt.cm.get_cmap("jet")
-    c_ticks = np.linspace(
-        levels[0], levels[-1], 5
-    )  # Tick values for colourbar.
-    ax.autoscale(False)
+        return dict(
+            fig=fig,
+            ax=ax,
+            cylinders=cylinders,
+            texture_line=texture_line,
+            texture=texture,
+            title_text=title_text,
+            layers=[ax, title_text],
+        )
 
-    norm = matplotlib.colors.Normalize(vmin=-c_scale, vmax=c_scale)
-    sm = matplotlib.cm.ScalarMappable(cmap=cmap, norm=norm)
-    sm.set_array([])
-    cbar = plt.colorbar(sm, ticks=c_ticks)
-    cbar.ax.set_title(colorbar_title, y=1.1)
-    pos = cbar.ax.get_position()
-    cbar.ax.set_position(
-        [pos.x0 + 0.05, pos.y0 * 2, pos.width, pos.height / 2]
+    t = get_template(
+        template_key("cylinders_3D", flow_class, n_cylinders), build, template
     )
+    fig, ax, cylinders = t["fig"], t["ax"], t["cylinders"]
+    texture_line = t["texture_line"]
+    shell, theta, a, b, height, hidden = t["texture"]
+    title_text = t["title_text"]
+
+    # Set colour by the velocity at the middle of each shell, looked up for
+    # every frame at once. The bottom half iterates inside out, same as
+    # data, and the top half outside in.
+    colours = flow_class.shell_colours()
+
+    def shell_colours(i):
+        return np.concatenate((colours[:, i], colours[::-1, i])) / 255
+
+    cylinders.set_facecolor(shell_colours(time_idx))
+
+    # Texture is advected by the displacement of its shell at each frame.
+    # Points of all shells are placed at once.
+    phase = flow_class.texture_phase(animate)
+
+    def texture_xy(i):
+        th = theta + phase[shell, i]
+        x = a * np.sin(th)
+        y = b * np.cos(th) + height
+        x[hidden[shell, hidden_index(th)]] = np.nan
+        return x, y
 
-    # Create list of cylinders and set colour
-    cylinders = []
-    for i in range(n_cylinders):
-        cylinders.append([top[i], bottom[-i - 1]])
-        for c in cylinders[-1]:
-            c.set_facecolor(
-                cmap(
-                    0.5
-                    * (
-                        1
-                        + (
-                            (data[i + 1, 0, time_idx] + data[i, 0, time_idx])
-                            / 2
-                        )
-                        / c_scale
-                    )
-                )[:-1]
-            )
+    texture_line.set_data(*texture_xy(time_idx))
 
-    # So they iterate inside out, same as data
-    cylinders = cylinders[::-1]
-    texture_funcs = texture_funcs[::-1]
-    texture_plots = texture_plots[::-1]
-    texture_theta = np.flipud(texture_theta)
+    title_text.set_text("")
 
     # Define the update function for animation
     ########
     def update(i):
 
         # print progess to screen if saving, every 10 frames
-        if progress:
-            text = "\rSaving frame " + str(i + 1) + "/" + str(data.shape[2])
+        if progress and i in frames:
+            n = frames.index(i) + 1
+            text = "\rSaving frame " + str(n) + "/" + str(len(frames))
             sys.stdout.write(text)
             sys.stdout.flush()
 
-        cmap = plt.cm.get_cmap("jet")
-
-        # Set colors of cylinders by data and advect texture
-        for j in range(len(cylinders)):
-            for c in cylinders[j]:
-                c.set_facecolor(
-                    cmap(
-                        0.5
-                        * (
-                            1
-                            + ((data[j + 1, 0, i] + data[j, 0, i]) / 2)
-                            / c_scale
-                        )
-                    )[:-1]
-                )
+        stats.start(i)
+        c = shell_colours(i)
+        xy = texture_xy(i)
+        stats.lap("data")
 
-            factor = 100
-            texture_theta[j][:] += (
-                -((data[j + 1, 0, i] + data[j, 0, i]) / 2) * speed / factor
-            )
-            x_t, y_t = texture_funcs[j](texture_theta[j])
-            texture_plots[j][0].set_data(x_t, y_t)
+        # Set colors of cylinders by data
+        cylinders.set_facecolor(c)
+
+        # Advect texture
+        texture_line.set_data(*xy)
+
+        title_text.set_text(title % time[i])
+        stats.lap("update")
 
-        plt.title(title % time[i])
+        return [cylinders, texture_line, title_text]
 
     #########
 
@@ -842,6 +3362,291 @@ def cylinder_3D_figure(flow_class, time_idx=0):
         fig,
         ax,
         cylinders,
-        [texture_funcs, texture_plots, texture_theta],
+        texture_line,
         update,
     )
+
+
+###############################################################################
+
+
+# Command line
+###############################################################################
+
+
+# Plot types and the FLOW settings that can be given on the command line
+RENDER_PLOTS = ["cylinders", "cylinders_3D", "contours", "raster"]
+RENDER_SETTINGS = {
+    "dpi": int,
+    "fps": int,
+    "speed": float,
+    "title": str,
+    "colorbar_title": str,
+    "cmap": str,
+    "c_scale": float,
+    "max_frames": int,
+    "target_duration": float,
+    "movie_writer": str,
+    "codec": str,
+    "crf": int,
+}
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".pdf", ".svg", ".tif", ".tiff")
+
+
+def load_flow(filename):
+    # FLOW class from a .npy file or a comma separated text file
+    if filename.endswith(".npy"):
+        return FLOW.from_npy(filename)
+    return FLOW.from_text(filename)
+
+
+def render_job(job):
+
+    """
+    Render one job of the command line interface: load its input file,
+    apply its settings and save a movie (or a still image if the output has
+    an image extension). The output is written to a temporary file that is
+    renamed once complete, so a file at the output path is always finished.
+
+    Parameters
+    ----------
+
+        'job' : dict.
+            "input" and "output" filenames, "plot" type, "time_idx" for
+            still images and "settings" to set on the FLOW class.
+
+    Returns
+    -------
+
+        'result' : dict.
+            The job with its "status" ("rendered" or "failed"), "seconds"
+            taken and any "error".
+
+    """
+
+    import io
+    import contextlib
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    t0 = perf_counter()
+    output = job["output"]
+    folder, name = os.path.split(output)
+    tmp = os.path.join(folder, ".partial-" + name)
+
+    try:
+        f = load_flow(job["input"])
+        for key, value in job["settings"].items():
+            if key not in RENDER_SETTINGS:
+                raise ValueError("Unknown setting '" + key + "'")
+            setattr(f, key, value)
+
+        still = output.lower().endswith(IMAGE_EXTENSIONS)
+        f.movie_filename = tmp
+        f.image_filename = tmp
+
+        plot = job["plot"]
+        kwargs = dict(animate=not still, save=True, time_idx=job["time_idx"])
+        # Progress of concurrent jobs would be interleaved, so hide it
+        with contextlib.redirect_stdout(io.StringIO()):
+            if plot == "raster":
+                f.plot_contours(mode="raster", **kwargs)
+            elif plot in RENDER_PLOTS:
+                getattr(f, "plot_" + plot)(**kwargs)
+            else:
+                raise ValueError("Unknown plot type '" + plot + "'")
+        plt.close("all")
+
+        os.replace(tmp, output)
+        status, error = "rendered", None
+    except Exception as e:
+        plt.close("all")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        status, error = "failed", "%s: %s" % (type(e).__name__, e)
+
+    return dict(job, status=status, seconds=perf_counter() - t0, error=error)
+
+
+def is_complete(job):
+    # Output already exists and is at least as new as the input
+    return os.path.isfile(job["output"]) and os.path.getmtime(
+        job["output"]
+    ) >= os.path.getmtime(job["input"])
+
+
+def read_manifest(filename):
+    # Jobs listed in a JSON manifest, either a list of jobs or a dictionary
+    # with "defaults" for every job and a list of "jobs". Each job is an
+    # input filename or a dictionary with "input" and optionally "output",
+    # "plot", "time_idx" and any of the settings. Relative paths are relative
+    # to the manifest.
+    with open(filename) as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {"jobs": manifest}
+
+    folder = os.path.dirname(os.path.abspath(filename))
+    jobs = []
+    for job in manifest["jobs"]:
+        if isinstance(job, str):
+            job = {"input": job}
+        job = dict(manifest.get("defaults", {}), **job)
+        for key in ("input", "output"):
+            if key in job:
+                job[key] = os.path.join(folder, job[key])
+        jobs.append(job)
+    return jobs
+
+
+def main(argv=None):
+
+    """
+    Command line interface, installed as `taco-vis`. Currently provides
+    `taco-vis render`, which renders movies or images of a list of data
+    files concurrently. See `taco-vis render --help`.
+
+    Returns
+    -------
+
+        'code' : int.
+            Exit code: 0 if every job was rendered or already complete, 1 if
+            any failed.
+
+    """
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="taco-vis",
+        description="Torsional Axisymmetric Core Oscillation Visualiser",
+    )
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    render = commands.add_parser(
+        "render",
+        help="render data files to movies or images",
+        description="Render .npy or comma separated text data files to "
+        "movies, or to still images if the output has an image extension. "
+        "Outputs that already exist and are newer than their input are "
+        "skipped.",
+    )
+    render.add_argument("inputs", nargs="*", help="data files to render")
+    render.add_argument(
+        "--manifest",
+        help="JSON file listing jobs, each an input file or a dictionary of "
+        "'input', 'output', 'plot', 'time_idx' and settings, optionally with "
+        "'defaults' for every job",
+    )
+    render.add_argument(
+        "--plot",
+        choices=RENDER_PLOTS,
+        default="cylinders_3D",
+        help="type of plot (default cylinders_3D)",
+    )
+    render.add_argument(
+        "--output",
+        default="{stem}_{plot}.mp4",
+        help="output filename, formatted with the input's {stem} and {name} "
+        "and the {plot} type. Relative paths are placed next to the input "
+        "(default {stem}_{plot}.mp4)",
+    )
+    render.add_argument(
+        "--time-idx", type=int, default=0, help="time index of still images"
+    )
+    for key, kind in RENDER_SETTINGS.items():
+        render.add_argument(
+            "--" + key.replace("_", "-"), type=kind, dest=key, help=key
+        )
+    render.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of files rendered at once (default 1)",
+    )
+    render.add_argument(
+        "--force",
+        action="store_true",
+        help="render outputs that are already complete",
+    )
+    render.add_argument(
+        "--report", help="also save the summary of every job to this JSON file"
+    )
+    args = parser.parse_args(argv)
+
+    settings = {
+        key: getattr(args, key)
+        for key in RENDER_SETTINGS
+        if getattr(args, key) is not None
+    }
+    defaults = dict(plot=args.plot, output=args.output, time_idx=args.time_idx)
+
+    # Each job is a dictionary of input, output, plot, time_idx and settings
+    jobs = [{"input": name} for name in args.inputs]
+    if args.manifest:
+        jobs += read_manifest(args.manifest)
+    if not jobs:
+        parser.error("no input files or manifest given")
+
+    for n, job in enumerate(jobs):
+        # Any other key of a manifest job is a setting
+        job = dict(defaults, **job)
+        job["settings"] = dict(
+            settings,
+            **{k: v for k, v in job.items() if k not in ["input", *defaults]}
+        )
+        name = os.path.basename(job["input"])
+        output = job["output"].format(
+            stem=os.path.splitext(name)[0], name=name, plot=job["plot"]
+        )
+        job["output"] = os.path.join(os.path.dirname(job["input"]), output)
+        jobs[n] = {
+            k: job[k]
+            for k in ("input", "output", "plot", "time_idx", "settings")
+        }
+
+    results = [None] * len(jobs)
+    todo = []
+    for n, job in enumerate(jobs):
+        if not args.force and is_complete(job):
+            results[n] = dict(job, status="skipped", seconds=0, error=None)
+        else:
+            todo.append(n)
+
+    with concurrent.futures.ProcessPoolExecutor(max(1, args.jobs)) as pool:
+        futures = {pool.submit(render_job, jobs[n]): n for n in todo}
+        for future in concurrent.futures.as_completed(futures):
+            n = futures[future]
+            result = results[n] = future.result()
+            print(
+                "%-8s %7.1fs  %s"
+                % (result["status"], result["seconds"], result["output"])
+            )
+            if result["error"]:
+                print("         " + result["error"])
+
+    counts = {
+        s: sum(r["status"] == s for r in results)
+        for s in ("rendered", "skipped", "failed")
+    }
+    print(
+        "\n%d rendered, %d skipped (already complete), %d failed"
+        % (counts["rendered"], counts["skipped"], counts["failed"])
+    )
+    for r in results:
+        if r["status"] == "failed":
+            print("FAILED " + r["output"] + ": " + r["error"])
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"counts": counts, "jobs": results}, f, indent=1)
+
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,14 @@
 import taco_vis as tv
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
 import os
+import sys
+import subprocess
+import pickle
+import json
+import contextlib
+import io
 
 
 ########################
@@ -25,6 +32,21 @@ assert np.min(f.data) < 0, 'Data has no negative values'
 assert np.max(f.data) > 0, 'Data has no positive values'
 
 
+# Test theta resampling matches np.interp for each (radius, time) pair
+theta_new = np.linspace(0, 2 * np.pi, 37)
+expected = np.zeros((radius.size, theta_new.size, time.size))
+for i in range(radius.size):
+    for j in range(time.size):
+        expected[i, :, j] = np.interp(theta_new, theta, data[i, :, j])
+assert np.array_equal(tv.resample_theta(data, 37), expected), 'Resampled data does not match np.interp'
+
+# Resampling periodic data onto the same grid should return it unchanged
+periodic = np.cos(np.linspace(0, 2 * np.pi, 9))[np.newaxis, :, np.newaxis] * np.ones((3, 1, 4))
+for method in ["linear", "periodic", "nearest"]:
+    resampled = tv.resample_theta(tv.resample_theta(periodic, 9, method), 9, method)
+    assert np.array_equal(resampled, periodic), 'Resampling onto the same grid changed the data ({})'.format(method)
+
+
 # Test animate contour plot_contours
 f.colorbar_title = "Non-dimensional\nvelocity"
 f.movie_filename = "test_contour.mp4"
@@ -43,11 +65,106 @@ plt.close("all")
 assert os.path.isfile(f.image_filename), 'File {} does not exist after saving'.format(f.movie_filename)
 
 
+# Test raster mode of plot_contours
+f.image_filename = "test_contour_raster.png"
+f.plot_contours(save=True, time_idx=14, mode="raster")
+plt.close("all")
+assert os.path.isfile(f.image_filename), 'File {} does not exist after saving'.format(f.image_filename)
+
+
 #Create axisymmetric data
 data_axisym = flow_func(R, np.pi/2, T)
 
 f_axisym = tv.FLOW(data_axisym)
 
+# 2D (radius, time) input should be broadcast in theta rather than copied
+f_2D = tv.FLOW(data_axisym[:, 0, :])
+assert np.shares_memory(f_2D.data, data_axisym), 'Axisymmetric data was copied'
+assert f_2D.data.shape == (radius.size, 50, time.size), 'Axisymmetric data has wrong shape'
+
+
+# Data loaded from a .npy file should stay memory-mapped, also when the class
+# is copied to a worker process
+np.save("test_data.npy", data_axisym[:, 0, :])
+f_npy = tv.FLOW.from_npy("test_data.npy")
+assert isinstance(f_npy._axisymmetric_data, np.memmap), 'Data from .npy file is not memory-mapped'
+assert f_npy.c_scale == f_2D.c_scale, 'c_scale of memory-mapped data is wrong'
+f_copy = pickle.loads(pickle.dumps(f_npy))
+assert isinstance(f_copy._axisymmetric_data, np.memmap), 'Memory-mapped data was copied when pickled'
+assert np.array_equal(f_copy.data, f_2D.data), 'Memory-mapped data changed when pickled'
+del f_npy, f_copy
+
+# Text data should be parsed once and then loaded from its binary cache
+np.savetxt("test_data.txt", data_axisym[:, 0, :], delimiter=",")
+f_text = tv.FLOW.from_text("test_data.txt")
+assert os.path.isfile("test_data.txt.npy"), 'Text data was not cached'
+assert np.allclose(f_text.data, f_2D.data), 'Text data was read incorrectly'
+# The text file is unchanged, so a replaced cache should be loaded as is
+np.save("test_data.txt.npy", np.zeros((2, 2)))
+assert tv.FLOW.from_text("test_data.txt").data.shape[0] == 2, 'Cache was not used'
+with open("test_data.txt", "a") as f_txt:
+    f_txt.write(",".join(["0"] * time.size) + "\n")
+assert tv.FLOW.from_text("test_data.txt").data.shape[0] == radius.size + 1, 'Cache was not remade after the file changed'
+del f_text
+
+# Test regridding matches np.interp in time then radius
+f_regrid = tv.FLOW(data_axisym[:, 0, :])
+f_regrid.regrid(n_radius=7, n_time=20)
+expected = np.array([np.interp(f_regrid.time, f_2D.time, u) for u in data_axisym[:, 0, :]])
+expected = np.array([np.interp(f_regrid.radius, radius, u) for u in expected.T]).T
+assert f_regrid.data.shape == (7, 50, 20), 'Regridded data has wrong shape'
+assert np.allclose(f_regrid.data[:, 0, :], expected), 'Regridded data does not match np.interp'
+
+# Unevenly spaced times are regridded against their physical values
+uneven = f_2D.time[0] + (f_2D.time - f_2D.time[0]) ** 2 / np.ptp(f_2D.time)
+f_regrid = tv.FLOW(data_axisym[:, 0, :])
+f_regrid.time = uneven
+f_regrid.regrid(n_time=20)
+expected = np.array([np.interp(f_regrid.time, uneven, u) for u in data_axisym[:, 0, :]])
+assert np.allclose(f_regrid.time, np.linspace(uneven[0], uneven[-1], 20)), 'Regridded times are not evenly spaced'
+assert np.allclose(f_regrid.data[:, 0, :], expected), 'Regridded data does not follow the physical times'
+
+# A budget larger than the data does not add points
+f_regrid = tv.FLOW(data_axisym[:, 0, :])
+f_regrid.regrid(n_radius=7, max_points=10 ** 6)
+assert f_regrid.data.shape == (7, 50, time.size), 'Budget added points in time'
+f_regrid = tv.FLOW(data_axisym[:, 0, :])
+f_regrid.regrid(n_time=20, max_points=10 ** 6)
+assert f_regrid.data.shape == (radius.size, 50, 20), 'Budget added points in radius'
+
+# Shell colour table should match mapping the shell midpoints directly
+colours = f_2D.shell_colours()
+assert colours.shape == (radius.size - 1, time.size, 4) and colours.dtype == np.uint8, 'Shell colour table has wrong shape or type'
+mid = (data_axisym[1:, 0, 7] + data_axisym[:-1, 0, 7]) / 2
+expected = plt.cm.get_cmap("jet")(mid / (2 * f_2D.c_scale) + 0.5, bytes=True)
+assert np.array_equal(colours[:, 7], expected), 'Shell colours do not match the colormap'
+
+# Cylinder geometry should be cached and match placing the dots shell by shell
+shell, th = tv.cylinder_dots(5)
+assert tv.cylinder_dots(5) is tv.cylinder_dots(5), 'Cylinder dots are not cached'
+assert tv.cylinder_3D_layout(5) is tv.cylinder_3D_layout(5), 'Cylinder 3D layout is not cached'
+for i, n_dots in enumerate([2, 3, 5, 7, 9]):
+    assert np.allclose(th[shell == i], np.linspace(0, 2 * np.pi, n_dots + 1)[:-1]), 'Cylinder dots are misplaced'
+shell_3D, theta_3D = tv.cylinder_3D_layout(5)[1][:2]
+assert np.array_equal(np.bincount(shell_3D), [2, 3, 5, 7, 9]) and np.all(np.diff(shell_3D) <= 0), 'Cylinder 3D texture is misplaced'
+
+# Hidden texture points should match testing every cylinder inside each shell
+n = 40
+radius_3D = np.linspace(1, 0, n + 1)
+heights_3D = np.sqrt(1 - radius_3D ** 2)
+heights_3D[0] = -heights_3D[1] + 0.3
+th_3D = np.arange(720) * 2 * np.pi / 720
+expected = []
+for i in range(n):
+    scale = (radius_3D[i] + radius_3D[i + 1]) / 2
+    x = (scale * np.sin(th_3D))[:, np.newaxis]
+    y = (scale / 1.5 * np.cos(th_3D) + heights_3D[i + 1] + 0.01)[:, np.newaxis]
+    a = radius_3D[i + 1 : -1]
+    s = a / 1.5 * np.sqrt(np.clip(1 - (x / a) ** 2, 0, None))
+    expected.append(((np.abs(x) < a) & (y > heights_3D[i + 1 : -1] - s) & (y < heights_3D[i + 2 :] + s)).any(axis=1))
+hidden_3D = tv.cylinder_3D_layout(n)[1][5]
+assert hidden_3D.any() and np.array_equal(hidden_3D, expected[::-1]), 'Hidden texture points are wrong'
+
 f_axisym.image_filename = "test_cylinders.png"
 f_axisym.colorbar_title = "Non-dimensional\nvelocity"
 f_axisym.plot_cylinders(save=True, time_idx=14)
@@ -61,3 +178,256 @@ f_axisym.plot_cylinders_3D(save=True, time_idx=14)
 # If plotting another image, close this animation figure first.
 plt.close("all")
 assert os.path.isfile(f_axisym.image_filename), 'File {} does not exist after saving'.format(f_axisym.movie_filename)
+
+
+# Stills rendered from one figure should match a frame drawn by a new figure
+names = f_axisym.render_stills([3, 14], pattern="test_still_{:02d}.png", kind="cylinders_3D")
+assert names == ["test_still_03.png", "test_still_14.png"], 'Wrong still filenames'
+fig, update = tv.make_figure(f_axisym, "cylinders_3D")
+update(14)
+fig.savefig("test_still_savefig.png", dpi=f_axisym.dpi)
+plt.close("all")
+assert np.array_equal(plt.imread("test_still_14.png"), plt.imread("test_still_savefig.png")), 'Still differs from plt.savefig'
+
+# Raster templates only redraw the image, spine and title over their
+# background, which should still match a full draw
+f.render_stills([14], pattern="test_still_raster_{:02d}.png", kind="raster")
+fig, update = tv.make_figure(f, "raster")
+update(14)
+fig.savefig("test_still_raster_savefig.png", dpi=f.dpi)
+plt.close("all")
+assert np.array_equal(plt.imread("test_still_raster_14.png"), plt.imread("test_still_raster_savefig.png")), 'Raster still differs from plt.savefig'
+
+# Stills are only saved in raster formats, .tif included
+f_axisym.render_stills([14], pattern="test_still_{:02d}.tif", kind="cylinders_3D")
+assert np.array_equal(plt.imread("test_still_14.tif"), np.round(plt.imread("test_still_14.png") * 255)), 'TIFF still differs from PNG'
+for pattern in ("test_still_{:02d}.pdf", "test_still_{:02d}.svg"):
+    try:
+        f_axisym.render_stills([14], pattern=pattern)
+        assert False, 'Vector still format was accepted'
+    except ValueError:
+        pass
+
+# A second render with the same grid and settings should reuse the figure
+# template and draw the same image. The cache is bounded and can be cleared.
+hits = tv.templates.hits
+f_axisym.render_stills([14], pattern="test_still_template_{:02d}.png", kind="cylinders_3D")
+assert tv.templates.hits == hits + 1, 'Figure template was not reused'
+assert np.array_equal(plt.imread("test_still_template_14.png"), plt.imread("test_still_14.png")), 'Reused template draws a different image'
+tv.templates.max_size = 1
+f_axisym.render_stills([14], pattern="test_still_template_{:02d}.png", kind="cylinders")
+assert len(tv.templates) == 1, 'Template cache is not bounded'
+tv.templates.clear()
+assert len(tv.templates) == 0, 'Template cache was not cleared'
+tv.templates.max_size = 8
+
+# Blitted frames of interactive playback should match a full draw of the frame
+for flow, kind in [(f_axisym, "cylinders"), (f, "contours"), (f, "raster")]:
+    flow.frame_stop = 3
+    if kind == "raster":
+        flow.plot_contours(animate=True, mode="raster")
+    else:
+        getattr(flow, "plot_" + kind)(animate=True)
+    fig = flow.ani._fig
+    fig.canvas.draw()
+    for i in range(3):
+        flow.ani._step()
+        full, update = tv.make_figure(flow, kind, time_idx=i)
+        update(i)
+        full.canvas.draw()
+        assert np.array_equal(np.asarray(fig.canvas.buffer_rgba()), np.asarray(full.canvas.buffer_rgba())), 'Blitted {} frame differs from a full draw'.format(kind)
+    flow.frame_stop = None
+    plt.close("all")
+
+# Replayed frames of interactive playback should come from the frame cache and
+# match the frames first drawn, also when compressed. The cache is bounded.
+for compress in [False, True]:
+    f_axisym.frame_cache_mb = 100
+    f_axisym.frame_cache_compress = compress
+    f_axisym.frame_stop = 5
+    f_axisym.plot_cylinders_3D(animate=True)
+    fig = f_axisym.ani._fig
+    fig.canvas.draw()
+    drawn = []
+    for i in range(6):
+        f_axisym.ani._step()
+        drawn.append(np.array(fig.canvas.buffer_rgba()))
+    for i in range(5):
+        f_axisym.ani._step()
+        assert np.array_equal(np.asarray(fig.canvas.buffer_rgba()), drawn[i]), 'Cached frame differs from the drawn frame'
+    assert (f_axisym.frame_cache.hits, f_axisym.frame_cache.misses) == (5, 5), 'Frames were not replayed from the cache'
+    plt.close("all")
+f_axisym.frame_cache_mb = 2.5 * drawn[0].nbytes / 2 ** 20
+f_axisym.frame_cache_compress = False
+f_axisym.plot_cylinders_3D(animate=True)
+f_axisym.ani._fig.canvas.draw()
+for i in range(5):
+    f_axisym.ani._step()
+assert len(f_axisym.frame_cache) == 2, 'Frame cache is not bounded'
+assert len(pickle.loads(pickle.dumps(f_axisym)).frame_cache) == 0, 'Cached frames were pickled'
+plt.close("all")
+f_axisym.frame_cache_mb = None
+f_axisym.frame_stop = None
+
+# The viewer should draw frames around the one shown in the background, show
+# them from the cache, and draw other frames once the slider rests
+f_axisym.view("cylinders_3D", time_idx=3, prefetch=2)
+viewer = f_axisym.viewer
+viewer.fig.canvas.draw()
+viewer.prefetching.result()
+assert sorted(f_axisym.frame_cache._frames) == [1, 2, 3, 4, 5], 'Viewer did not prefetch the frames around the one shown'
+def plot_pixels(fig):
+    # Pixels above the viewer's controls
+    pixels = np.asarray(fig.canvas.buffer_rgba())
+    return pixels[: int(0.9 * pixels.shape[0])].copy()
+fig, update = tv.make_figure(f_axisym, "cylinders_3D")
+for i in [4, 20]:
+    hits = f_axisym.frame_cache.hits
+    viewer.slider.set_val(i)
+    assert (f_axisym.frame_cache.hits > hits) == (i == 4), 'Viewer did not show the cached frame'
+    viewer.render()
+    viewer.fig.canvas.draw()
+    update(i)
+    fig.canvas.draw()
+    assert np.array_equal(plot_pixels(viewer.fig), plot_pixels(fig)), 'Viewer shows a different frame'
+viewer.step()
+assert viewer.index == 21, 'Viewer did not step to the next frame'
+viewer.close()
+plt.close("all")
+
+
+# Test the cylinder texture of a frame does not depend on earlier frames
+f_axisym.progress = False
+fig, update = tv.make_figure(f_axisym, "cylinders")
+for i in range(21):
+    dots_in_order = update(i)[1].get_xydata()
+plt.close("all")
+fig, update = tv.make_figure(f_axisym, "cylinders")
+assert np.allclose(update(20)[1].get_xydata(), dots_in_order), 'Texture of a frame depends on earlier frames'
+plt.close("all")
+
+
+# Test parallel rendering gives the same frames as a serial render
+def frame_hashes(filename):
+    ffmpeg = matplotlib.rcParams["animation.ffmpeg_path"]
+    out = subprocess.run(
+        [ffmpeg, "-loglevel", "error", "-i", filename, "-f", "framemd5", "-"],
+        stdout=subprocess.PIPE, universal_newlines=True, check=True
+    ).stdout
+    return [l.split(",")[-1] for l in out.splitlines() if not l.startswith("#")]
+
+f_axisym.dpi = 50
+f_axisym.movie_filename = "test_cylinders_serial.mp4"
+f_axisym.plot_cylinders(animate=True, save=True)
+plt.close("all")
+f_axisym.movie_filename = "test_cylinders_parallel.mp4"
+f_axisym.plot_cylinders(animate=True, save=True, workers=2)
+plt.close("all")
+assert frame_hashes("test_cylinders_serial.mp4") == frame_hashes("test_cylinders_parallel.mp4"), 'Parallel render differs from serial render'
+
+# Test the ffmpeg pipe writer gives the same frames as matplotlib's writer
+f_axisym.movie_writer = "pipe"
+f_axisym.movie_filename = "test_cylinders_pipe.mp4"
+f_axisym.plot_cylinders(animate=True, save=True)
+plt.close("all")
+assert frame_hashes("test_cylinders_serial.mp4") == frame_hashes("test_cylinders_pipe.mp4"), 'Pipe writer differs from matplotlib writer'
+
+# Test streamed time slices give the same frames as the full dataset
+f_stream = tv.FLOW.from_frames(data_axisym[:, 0, :1], window=20)
+f_stream.dpi = 50
+f_stream.c_scale = f_axisym.c_scale
+f_stream.colorbar_title = f_axisym.colorbar_title
+f_stream.movie_filename = "test_cylinders_stream.mp4"
+f_stream.plot_stream(
+    (data_axisym[:, 0, i] for i in range(1, time.size)), save=True
+)
+assert frame_hashes("test_cylinders_serial.mp4") == frame_hashes("test_cylinders_stream.mp4"), 'Streamed frames differ from serial render'
+
+# Test only the selected frames are drawn, also when rendering in parallel,
+# stills and progress do not depend on which frames are drawn, and animations
+# start from the texture of the still
+phase = f_axisym.texture_phase()
+f_axisym.max_frames = 10
+assert np.array_equal(f_axisym.texture_phase(), phase), 'Still texture depends on the frames drawn'
+start = f_axisym.frame_indices()[0]
+assert np.allclose(f_axisym.texture_phase(animate=True)[:, start], phase[:, start]), 'Animated texture does not start from the still'
+f_axisym.movie_filename = "test_cylinders_max_frames.mp4"
+hooked = []
+f_axisym.frame_hook = lambda i, timings: hooked.append(i)
+with contextlib.redirect_stdout(io.StringIO()) as out:
+    f_axisym.plot_cylinders(animate=True, save=True)
+plt.close("all")
+assert out.getvalue().split("\r")[-1].split()[:3] == ["Saving", "frame", "10/10"], 'Progress does not count the frames drawn'
+assert hooked == list(f_axisym.frame_indices()), 'Frame hook was not called for every frame'
+assert f_axisym.stats.summary()["frames"] == 10, 'Frame timings were not recorded'
+f_axisym.movie_filename = "test_cylinders_max_frames_parallel.mp4"
+f_axisym.plot_cylinders(animate=True, save=True, workers=2)
+plt.close("all")
+assert len(frame_hashes("test_cylinders_max_frames.mp4")) == 10, 'Wrong number of frames drawn'
+assert frame_hashes("test_cylinders_max_frames.mp4") == frame_hashes("test_cylinders_max_frames_parallel.mp4"), 'Parallel render of selected frames differs from serial render'
+assert sorted(f_axisym.stats.frames) == list(f_axisym.frame_indices()), 'Frame timings were not collected from the workers'
+
+# Test skipping frames does not alias the texture into turning the wrong way:
+# each step moves the dots by -0.1, well under half their spacing, but five
+# steps at once would look like a forward turn
+f_strided = tv.FLOW(np.ones((11, 50)))
+f_strided.speed = 10
+f_strided.max_frames = 10
+f_strided.progress = False
+frames = f_strided.frame_indices()
+fig, update = tv.make_figure(f_strided, "cylinders", animate=True)
+first = update(frames[0])[1].get_xdata()[-19:].copy()
+second = update(frames[1])[1].get_xdata()[-19:].copy()
+plt.close("all")
+spacing = 2 * np.pi / 19
+step = (second - first + spacing / 2) % spacing - spacing / 2
+assert np.all(step < 0), 'Texture turns the wrong way when frames are skipped'
+assert np.allclose(step, -0.1), 'Texture does not keep its speed when frames are skipped'
+
+# Test the frame timings are bounded, e.g. for looping playback
+stats = tv.FrameStats()
+stats.max_frames = 3
+stats.reset()
+for i in range(5):
+    stats.start(i)
+stats.end()
+assert list(stats.frames) == [2, 3, 4] and stats.summary()["frames"] == 3, 'Frame timings are not bounded'
+assert json.loads(stats.to_json())["frames"] == [2, 3, 4], 'Frame timings were not exported'
+
+# Test the command line renders each file once and reports failures
+plt.close("all")
+np.save("test_cli_bad.npy", np.zeros(3))
+if os.path.isfile("test_data_cylinders.mp4"):
+    os.remove("test_data_cylinders.mp4")
+args = ["--plot", "cylinders", "--max-frames", "5"]
+assert tv.main(["render", "test_data.npy"] + args) == 0, 'Command line render failed'
+assert len(frame_hashes("test_data_cylinders.mp4")) == 5, 'Command line did not apply settings'
+mtime = os.path.getmtime("test_data_cylinders.mp4")
+assert tv.main(["render", "test_data.npy", "test_cli_bad.npy"] + args) == 1, 'Command line did not report a failed job'
+assert os.path.getmtime("test_data_cylinders.mp4") == mtime, 'Complete output was rendered again'
+assert not os.path.exists("test_cli_bad_cylinders.mp4"), 'Failed job left an output'
+
+# Importing the module should not import matplotlib, and a plot saved without
+# a display should use the Agg backend, unless another backend was chosen
+code = (
+    "import sys, numpy, taco_vis\n"
+    "assert 'matplotlib' not in sys.modules, 'matplotlib imported'\n"
+    "f = taco_vis.FLOW(numpy.random.rand(5, 1, 5))\n"
+    "f.image_filename = sys.argv[1]\n"
+    "f.plot_cylinders(save=True)\n"
+    "import matplotlib\n"
+    "print(matplotlib.get_backend())\n"
+)
+env = {k: v for k, v in os.environ.items() if k not in ("MPLBACKEND", "DISPLAY", "WAYLAND_DISPLAY")}
+out = subprocess.run(
+    [sys.executable, "-c", code, os.path.abspath("test_headless.png")],
+    cwd=os.path.dirname(os.path.abspath(tv.__file__)),
+    env=env, stdout=subprocess.PIPE, universal_newlines=True, check=True
+).stdout
+assert out.split()[-1].lower() == "agg", 'Saved plot did not use the Agg backend'
+out = subprocess.run(
+    [sys.executable, "-c", code, os.path.abspath("test_headless.svg")],
+    cwd=os.path.dirname(os.path.abspath(tv.__file__)),
+    env=dict(env, MPLBACKEND="svg"), stdout=subprocess.PIPE, universal_newlines=True, check=True
+).stdout
+assert out.split()[-1].lower() == "svg", 'Backend chosen by the user was replaced'